@@ -36,6 +36,8 @@ if "bpy" in locals():
     importlib.reload(op_gen)
     importlib.reload(op_export)
     importlib.reload(op_object)
+    importlib.reload(op_sweep)
+    importlib.reload(op_run)
 else:
     import bpy
     import os.path
@@ -45,6 +47,8 @@ else:
         op_gen,
         op_export,
         op_object,
+        op_sweep,
+        op_run,
         )
     
 
@@ -100,6 +104,13 @@ class SnappyHexMeshGUI_Settings(bpy.types.PropertyGroup):
         maxlen=1024,
         subtype="FILE_PATH",
     )
+    controldict_template_path: bpy.props.StringProperty(
+        name="controlDict Template Path",
+        description="Path to controlDict Template",
+        default=os.path.join(os.path.dirname(__file__), 'skel', 'controlDictTemplate'),
+        maxlen=1024,
+        subtype="FILE_PATH",
+    )
     export_path: bpy.props.StringProperty(
         name="Export Path",
         description="Path to Export Case Files. '//' means the folder where Blender file is saved",
@@ -112,12 +123,128 @@ class SnappyHexMeshGUI_Settings(bpy.types.PropertyGroup):
         description="Export STL files in ASCII instead of Binary Format",
         default=False,
     )
+    export_makefile: bpy.props.BoolProperty(
+        name="Makefile",
+        description="Export also a Makefile which Runs Independent Steps " \
+        + "Concurrently with 'make -j N' and Skips Up-to-date Steps",
+        default=True,
+    )
+    export_emesh_binary: bpy.props.BoolProperty(
+        name="Binary eMesh",
+        description="Export Feature Edge eMesh Files in Binary instead " \
+        + "of ASCII Format",
+        default=False,
+    )
+    extract_features_in_blender: bpy.props.BoolProperty(
+        name="Extract Features in Blender",
+        description="Write Feature Edge eMesh Files on Export " \
+        + "instead of Running surfaceFeatures or surfaceFeatureExtract",
+        default=False,
+    )
     number_of_cpus: bpy.props.IntProperty(
         name="CPUs",
         description="Number of CPUs for decomposeParDict",
         default=1,
         min=1,
     )
+    overwrite_mesh: bpy.props.BoolProperty(
+        name="Final Mesh Only",
+        description="Run snappyHexMesh with -overwrite to Write Only the " \
+        + "Final Mesh to constant/polyMesh instead of Time Directories " \
+        + "for Each Meshing Phase",
+        default=False,
+    )
+    keep_decomposed: bpy.props.BoolProperty(
+        name="Keep Decomposed",
+        description="Leave Mesh of Parallel Runs in processor Directories " \
+        + "Ready for a Parallel Solver Run instead of Reconstructing It",
+        default=False,
+    )
+    renumber_mesh: bpy.props.BoolProperty(
+        name="Renumber Mesh",
+        description="Renumber Decomposed Mesh with renumberMesh to " \
+        + "Reduce Matrix Bandwidth for the Solver",
+        default=False,
+    )
+    update_controldict: bpy.props.BoolProperty(
+        name="Update controlDict",
+        description="Overwrite Existing controlDict on Export with I/O " \
+        + "Settings. Otherwise controlDict is Written Only if It is Missing",
+        default=False,
+    )
+    write_format: bpy.props.EnumProperty(
+        name="Write Format",
+        description="Format of Mesh and Field Files Written by OpenFOAM " \
+        + "(writeFormat in controlDict)",
+        items={
+            ('ascii', 'ascii', 'Human Readable Text Files', 0),
+            ('binary', 'binary', 'Smaller Files which are Faster to ' \
+             + 'Write and Read', 1)},
+        default='ascii',
+    )
+    write_compression: bpy.props.BoolProperty(
+        name="Compression",
+        description="Compress Written Files with gzip (writeCompression " \
+        + "in controlDict, Applies to ascii Format)",
+        default=True,
+    )
+    write_diagnostic_fields: bpy.props.BoolProperty(
+        name="Diagnostic Fields",
+        description="Include writeCellCentres and writeCellVolumes " \
+        + "Function Objects in controlDict",
+        default=True,
+    )
+    collated_file_handler: bpy.props.BoolProperty(
+        name="Collated",
+        description="Use Collated File Handler which Writes Parallel Data " \
+        + "into a Single processorsN Directory instead of a Directory " \
+        + "per Process",
+        default=False,
+    )
+    use_resource_planner: bpy.props.BoolProperty(
+        name="Resource Planner",
+        description="Derive Number of CPUs, maxLocalCells and maxGlobalCells " \
+        + "from Estimated Cell Count and Available Resources",
+        default=False,
+    )
+    available_cores: bpy.props.IntProperty(
+        name="Available Cores",
+        description="Maximum Number of CPU Cores Available for the Run",
+        default=4,
+        min=1,
+    )
+    memory_per_core: bpy.props.FloatProperty(
+        name="RAM per Core (GB)",
+        description="Available Memory per CPU Core in Gigabytes",
+        default=2.0,
+        min=0.1,
+    )
+    cells_per_rank: bpy.props.IntProperty(
+        name="Cells per Rank",
+        description="Target Number of Cells per Parallel Process",
+        default=250000,
+        min=1000,
+    )
+    decomposition_method: bpy.props.EnumProperty(
+        name="Decomposition",
+        description="Decomposition Method for decomposeParDict",
+        items={
+            ('auto', 'auto', 'Choose Method Based on Domain Shape, ' \
+             + 'Refinement and Cores per Node', 0),
+            ('scotch', 'scotch', 'Graph Based Decomposition', 1),
+            ('hierarchical', 'hierarchical', 'Geometric Decomposition ' \
+             + 'with Balanced (nx ny nz) Split', 2),
+            ('multiLevel', 'multiLevel', 'Decomposition per Node and ' \
+             + 'per Core', 3)},
+        default='auto',
+    )
+    cores_per_node: bpy.props.IntProperty(
+        name="Cores per Node",
+        description="Number of CPU Cores per Compute Node for multiLevel " \
+        + "Decomposition. Value 0 means Single Node",
+        default=0,
+        min=0,
+    )
     do_castellation: bpy.props.BoolProperty(
         name="Castellation Phase",
         description="Do Castellation Phase",
@@ -242,6 +369,20 @@ class SnappyHexMeshGUI_Settings(bpy.types.PropertyGroup):
         default=1e-5,
         min=0.0
     )
+    sweep_definition: bpy.props.StringProperty(
+        name="Sweep Definition",
+        description="Sweep Parameters and Values for Sweep Export, e.g. " \
+        + "'cell_side_length=0.2,0.1; shmg_surface_max_level=2,3'. " \
+        + "Object (shmg_) Parameters are Applied to Selected Mesh Objects",
+        default="cell_side_length=0.2,0.1",
+        maxlen=1024,
+    )
+    sweep_case_prefix: bpy.props.StringProperty(
+        name="Sweep Case Prefix",
+        description="Name Prefix for Sweep Case Folders Created under Export Path",
+        default="sweep",
+        maxlen=1024,
+    )
     feature_snap_iter: bpy.props.IntProperty(
         name="Feature Snap Iter",
         description="Number of Feature Edge Snapping Iterations (nFeatureSnapIter)",
@@ -254,6 +395,7 @@ bpy.types.Object.shmg_include_in_export = bpy.props.BoolProperty(
     name="Include in export",
     description="Include mesh in export (SnappyHexMesh GUI)",
     default=True,
+    update=op_object.include_in_export_update,
 )
 bpy.types.Object.shmg_include_snapping = bpy.props.BoolProperty(
     name="Do Snap to Surface",
@@ -420,7 +562,10 @@ class VIEW3D_PT_SnappyHexMeshGUI_Object(bpy.types.Panel, SnappyHexMeshGUI_ToolBa
         col = layout.column()
         rowsub = col.row(align=True)
         rowsub.label(text="Options:")
-        rowsub.prop(gui, "number_of_cpus", text="CPUs:")
+        if gui.use_resource_planner:
+            rowsub.label(text="CPUs: %d" % op_object.get_resource_plan(scene)[0])
+        else:
+            rowsub.prop(gui, "number_of_cpus", text="CPUs:")
 
         if 'MOD_MULTIRES' in icon_names:
             rowsub.prop(gui, "do_castellation", text="", icon='MOD_MULTIRES')
@@ -442,6 +587,37 @@ class VIEW3D_PT_SnappyHexMeshGUI_Object(bpy.types.Panel, SnappyHexMeshGUI_ToolBa
             rowsub = col.row(align=True)
             rowsub.prop(gui, "do_add_layers", text="Add Layers")
 
+        rowsub = col.row()
+        rowsub.prop(gui, "use_resource_planner")
+        if gui.use_resource_planner:
+            rowsub = col.row(align=True)
+            rowsub.prop(gui, "available_cores", text="Cores")
+            rowsub.prop(gui, "memory_per_core", text="GB/Core")
+            rowsub = col.row()
+            rowsub.prop(gui, "cells_per_rank")
+            plan_warning = op_object.get_resource_plan_warning(scene)
+            if plan_warning:
+                rowsub = col.row()
+                rowsub.label(icon="ERROR", text=plan_warning)
+
+        rowsub = col.row(align=True)
+        rowsub.prop(gui, "decomposition_method", text="")
+        rowsub.prop(gui, "cores_per_node", text="Cores/Node")
+
+        rowsub = col.row(align=True)
+        rowsub.prop(gui, "write_format", text="")
+        rowsub.prop(gui, "write_compression")
+        rowsub.prop(gui, "write_diagnostic_fields", text="Diag. Fields")
+        rowsub = col.row(align=True)
+        rowsub.prop(gui, "update_controldict")
+
+        rowsub = col.row(align=True)
+        rowsub.prop(gui, "overwrite_mesh")
+        rowsub.prop(gui, "collated_file_handler")
+        rowsub.prop(gui, "keep_decomposed")
+        if gui.keep_decomposed:
+            rowsub.prop(gui, "renumber_mesh")
+
         rowsub = col.row()
         rowsub.prop(gui, "openfoam_framework")
 
@@ -541,6 +717,27 @@ class VIEW3D_PT_SnappyHexMeshGUI_Object(bpy.types.Panel, SnappyHexMeshGUI_ToolBa
         else:
             rowsub = col.row(align=True)
             rowsub.prop(gui, "export_stl_ascii", text="ASCII STL Format")
+        if 'SEQ_SEQUENCER' in icon_names:
+            rowsub.prop(gui, "export_makefile", text="", icon='SEQ_SEQUENCER')
+        else:
+            rowsub = col.row(align=True)
+            rowsub.prop(gui, "export_makefile", text="Makefile")
+        if 'MOD_EDGESPLIT' in icon_names:
+            rowsub.prop(gui, "extract_features_in_blender", text="", icon='MOD_EDGESPLIT')
+        else:
+            rowsub = col.row(align=True)
+            rowsub.prop(gui, "extract_features_in_blender", text="Extract Features")
+        if 'FILE_CACHE' in icon_names:
+            rowsub.prop(gui, "export_emesh_binary", text="", icon='FILE_CACHE')
+        else:
+            rowsub = col.row(align=True)
+            rowsub.prop(gui, "export_emesh_binary", text="Binary eMesh")
+
+        rowsub = col.row(align=True)
+        rowsub.operator("object.snappyhexmeshgui_sweep_export", text="Sweep Export")
+        rowsub.prop(gui, "sweep_case_prefix", text="")
+        rowsub = col.row()
+        rowsub.prop(gui, "sweep_definition", text="")
 
 
 class VIEW3D_PT_SnappyHexMeshGUI_Object_Summary(bpy.types.Panel, SnappyHexMeshGUI_ToolBar):
@@ -562,7 +759,7 @@ class VIEW3D_PT_SnappyHexMeshGUI_Object_Summary(bpy.types.Panel, SnappyHexMeshGU
         col = layout.column()
 
         # Global bounding box info
-        bb_min, bb_max = op_object.get_global_bbox_coords()
+        bb_min, bb_max = op_object.get_cached_global_bbox_coords(scene)
         bb_min_str = "[%7.3f %7.3f %7.3f]" % (bb_min[0], bb_min[1], bb_min[2])
         bb_max_str = "[%7.3f %7.3f %7.3f]" % (bb_max[0], bb_max[1], bb_max[2])
         rowsub = col.row()
@@ -574,10 +771,18 @@ class VIEW3D_PT_SnappyHexMeshGUI_Object_Summary(bpy.types.Panel, SnappyHexMeshGU
 
         # Block mesh cell count
         if gui.do_block_mesh:
-            bm_count = op_object.block_mesh_cell_count(bb_min, bb_max, gui)
+            bm_count = op_object.get_block_mesh_cell_count(bb_min, bb_max, gui.cell_side_length)
             rowsub = col.row(align=True)
             rowsub.label(text="Block Mesh Count: %d" % bm_count)
 
+        # Estimated cell counts
+        n_castellated, n_final = op_object.get_cached_cell_count_estimate(scene)
+        rowsub = col.row(align=True)
+        rowsub.label(text="Estimated Castellated Count: %d" % n_castellated)
+        if gui.do_add_layers:
+            rowsub = col.row(align=True)
+            rowsub.label(text="Estimated Final Count: %d" % n_final)
+
         # List objects included in export
         rowsub = col.row(align=True)
         rowsub.label(text="Objects included:")
@@ -590,6 +795,105 @@ class VIEW3D_PT_SnappyHexMeshGUI_Object_Summary(bpy.types.Panel, SnappyHexMeshGU
             rowsub.label(text="    %r" % obj.name)
 
         
+class VIEW3D_PT_SnappyHexMeshGUI_Run(bpy.types.Panel, SnappyHexMeshGUI_ToolBar):
+    """Run Metrics Panel in Object Mode"""
+    bl_idname = "VIEW3D_PT_snappyhexmeshgui_run"
+    bl_context = "objectmode"
+    bl_label = "Run"
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT'
+
+    def draw(self, context):
+        layout = self.layout
+
+        col = layout.column()
+        rowsub = col.row(align=True)
+        if op_run.is_run_active():
+            rowsub.operator("object.snappyhexmeshgui_cancel_run", text="Cancel Run")
+        else:
+            rowsub.operator("object.snappyhexmeshgui_run_case", text="Run")
+
+        run = op_run.active_run
+        if run:
+            rowsub = col.row()
+            rowsub.alert = run.returncode not in (None, 0)
+            rowsub.label(text=run.status)
+            progress = run.get_progress_text()
+            if progress:
+                rowsub = col.row()
+                rowsub.label(text="    " + progress)
+
+        rowsub = col.row(align=True)
+        rowsub.operator("object.snappyhexmeshgui_load_run_metrics", text="Load Run Metrics")
+        rowsub.operator("object.snappyhexmeshgui_parse_logs", text="Parse Logs")
+
+        rows = op_run.get_run_metrics_rows(op_run.run_metrics)
+        if rows:
+            rowsub = col.row(align=True)
+            for text in ["Step", "Time", "Share", "CPU", "Memory"]:
+                rowsub.label(text=text)
+            for name, elapsed, share, cpu, memory, status in rows:
+                rowsub = col.row(align=True)
+                rowsub.alert = status != 0
+                for text in [name, elapsed, share, cpu, memory]:
+                    rowsub.label(text=text)
+
+        report = op_run.run_report
+        if not report:
+            return
+        if report["export_date"]:
+            rowsub = col.row()
+            rowsub.label(text="Settings Exported: %s" % report["export_date"][:19])
+
+        snappy = report["snappy"]
+        if snappy:
+            if snappy.iterations:
+                rowsub = col.row()
+                rowsub.label(text="Refinement Iterations:")
+                for name, cells in snappy.iterations:
+                    rowsub = col.row()
+                    rowsub.label(text="    %s: %d cells" % (name, cells))
+            if snappy.phase_times:
+                rowsub = col.row()
+                rowsub.label(text="Phase Times:")
+                for name, seconds in snappy.phase_times:
+                    rowsub = col.row()
+                    rowsub.label(text="    %s: %.1f s" % (name, seconds))
+            for phase, text in snappy.memory[-5:]:
+                rowsub = col.row()
+                rowsub.label(text="    %s: %s" % (phase, text))
+            if snappy.layers:
+                rowsub = col.row(align=True)
+                for text in ["Patch", "Faces", "Layers", "Thickness"]:
+                    rowsub.label(text=text)
+                for name, faces, layers, thickness, percentage in snappy.layers:
+                    rowsub = col.row(align=True)
+                    rowsub.label(text=name)
+                    rowsub.label(text="%d" % faces)
+                    rowsub.label(text="%.2f" % layers)
+                    if percentage is None:
+                        rowsub.label(text="%.3g" % thickness)
+                    else:
+                        rowsub.label(text="%.3g (%.0f %%)" % (thickness, percentage))
+
+        check = report["check"]
+        if check:
+            rowsub = col.row()
+            if check.n_failed is None:
+                rowsub.label(text="checkMesh did not finish")
+            elif check.n_failed == 0:
+                rowsub.label(text="checkMesh: Mesh OK, %d cells" % (check.cells or 0))
+            else:
+                rowsub.alert = True
+                rowsub.label(text="checkMesh: Failed %d checks" % check.n_failed)
+            for text in check.failed_checks:
+                rowsub = col.row()
+                rowsub.alert = True
+                rowsub.label(text="    " + text)
+
+
 class VIEW3D_PT_SnappyHexMeshGUI_Object_Object(bpy.types.Panel, SnappyHexMeshGUI_ToolBar):
     """Object Setting Panel in Object Mode"""
     bl_idname = "VIEW3D_PT_snappyhexmeshgui_object_object"
@@ -687,12 +991,18 @@ classes = (
     VIEW3D_PT_SnappyHexMeshGUI_Edit,
     VIEW3D_PT_SnappyHexMeshGUI_Object_Object,
     VIEW3D_PT_SnappyHexMeshGUI_Object_Summary,
+    VIEW3D_PT_SnappyHexMeshGUI_Run,
     op_export.OBJECT_OT_snappyhexmeshgui_export,
     op_export.OBJECT_OT_snappyhexmeshgui_apply_locrotscale,
     op_export.OBJECT_OT_snappyhexmeshgui_add_location_in_mesh_object,
     op_export.OBJECT_OT_snappyhexmeshgui_cleanup_meshes,
     op_export.OBJECT_OT_snappyhexmeshgui_copy_settings_to_objects,
     op_export.OBJECT_OT_snappyhexmeshgui_clean_case_dir,
+    op_sweep.OBJECT_OT_snappyhexmeshgui_sweep_export,
+    op_run.OBJECT_OT_snappyhexmeshgui_load_run_metrics,
+    op_run.OBJECT_OT_snappyhexmeshgui_parse_logs,
+    op_run.OBJECT_OT_snappyhexmeshgui_run_case,
+    op_run.OBJECT_OT_snappyhexmeshgui_cancel_run,
     
     SnappyHexMeshGUI_Settings,
 )
@@ -703,8 +1013,17 @@ def register():
 
     bpy.types.Scene.snappyhexmeshgui = \
         bpy.props.PointerProperty(type = SnappyHexMeshGUI_Settings)
+
+    bpy.app.handlers.depsgraph_update_post.append(op_object.depsgraph_update_post_handler)
+    bpy.app.handlers.load_post.append(op_object.load_post_handler)
     
 def unregister():
+    op_run.cancel_run()
+    if bpy.app.timers.is_registered(op_run.run_timer_tick):
+        bpy.app.timers.unregister(op_run.run_timer_tick)
+    bpy.app.handlers.depsgraph_update_post.remove(op_object.depsgraph_update_post_handler)
+    bpy.app.handlers.load_post.remove(op_object.load_post_handler)
+
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
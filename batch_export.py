@@ -0,0 +1,205 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8-80 compliant>
+
+# ----------------------------------------------------------------------------
+# Headless batch export
+#
+# Export a single case from a Blender file (run by Blender):
+#
+#   blender -b model.blend --python batch_export.py -- /path/to/case
+#
+# Export many cases in parallel background Blender instances (run by
+# Python). Each line in the job file contains a Blender file path and
+# a case directory path, separated by white space:
+#
+#   python3 batch_export.py [-j N] [--blender PATH] jobs.txt
+
+import os
+import sys
+import time
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+# Name of the log file written to case directory by batch export jobs
+BATCH_LOG_NAME = "log.batchExport"
+
+
+class BatchReporter:
+    """Replacement for operator report() in batch export. Prints
+    messages and records whether errors were reported.
+    """
+
+    def __init__(self):
+        self.failed = False
+
+    def report(self, report_type, message):
+        if 'ERROR' in report_type:
+            self.failed = True
+        print("%s: %s" % (", ".join(sorted(report_type)), message))
+
+
+def get_addon_module():
+    """Imports and returns the add-on package containing this file,
+    and makes sure the add-on is registered
+    """
+
+    import addon_utils
+    import importlib.util
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    init_path = os.path.join(addon_dir, "__init__.py")
+
+    # Use the add-on module already loaded by Blender, if any
+    addon = None
+    for mod in addon_utils.modules():
+        if os.path.abspath(mod.__file__) == init_path:
+            addon = mod
+            break
+
+    # Otherwise load the package from file. The directory name is not
+    # used as module name, because it may not be a valid identifier.
+    if not addon:
+        name = "snappyhexmesh_gui"
+        spec = importlib.util.spec_from_file_location(
+            name, init_path, submodule_search_locations=[addon_dir])
+        addon = importlib.util.module_from_spec(spec)
+        sys.modules[name] = addon
+        spec.loader.exec_module(addon)
+
+    if not hasattr(bpy.types.Scene, "snappyhexmeshgui"):
+        addon.register()
+    return addon
+
+
+def export_in_blender(argv):
+    """Exports case from currently open Blender file to case directory
+    given as first argument after "--". Returns exit status.
+    """
+
+    if "--" not in argv or len(argv) <= argv.index("--") + 1:
+        print("Usage: blender -b model.blend --python %s -- CASE_DIR" \
+              % os.path.basename(__file__))
+        return 2
+    export_path = os.path.abspath(argv[argv.index("--") + 1])
+
+    addon = get_addon_module()
+    reporter = BatchReporter()
+    t0 = time.time()
+    n = addon.op_export.export_case(reporter, export_path)
+    print("Exported %d meshes from %r to %r in %.2f s" \
+          % (n, bpy.data.filepath, export_path, time.time() - t0))
+    if n == 0 or reporter.failed:
+        return 1
+    return 0
+
+
+def read_jobs(filepath):
+    """Returns list of (blend file path, case directory path) tuples
+    read from job file filepath. Empty lines and lines starting with #
+    are ignored.
+    """
+
+    jobs = []
+    with open(filepath, 'r') as infile:
+        for line in infile:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            blend_path, case_path = line.split(None, 1)
+            jobs.append((os.path.abspath(blend_path),
+                         os.path.abspath(case_path.strip())))
+    return jobs
+
+
+def run_job(blender, blend_path, case_path):
+    """Runs export of one case in a background Blender process. Output
+    is written to log file in case directory. Returns tuple of exit
+    status and elapsed time in seconds.
+    """
+
+    import subprocess
+    os.makedirs(case_path, exist_ok=True)
+    command = [blender, "-b", blend_path, "--python-exit-code", "1",
+               "--python", os.path.abspath(__file__), "--", case_path]
+    t0 = time.time()
+    with open(os.path.join(case_path, BATCH_LOG_NAME), 'w') as logfile:
+        try:
+            status = subprocess.call(command, stdout=logfile,
+                                     stderr=subprocess.STDOUT)
+        except OSError as e:
+            logfile.write("Failed to start %r: %s\n" % (blender, e))
+            status = 127
+    return status, time.time() - t0
+
+
+def run_jobs(jobs, blender, n_workers):
+    """Runs export jobs in a pool of n_workers background Blender
+    processes, prints per job timing and exit status. Returns number
+    of failed jobs.
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    t0 = time.time()
+    # Each worker thread only waits for its Blender process, the
+    # actual work is done in parallel Blender processes
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(run_job, blender, b, c) for b, c in jobs]
+        results = [f.result() for f in futures]
+
+    n_failed = 0
+    print("%-8s %10s  %s" % ("Status", "Time [s]", "Job"))
+    for (blend_path, case_path), (status, elapsed) in zip(jobs, results):
+        if status != 0:
+            n_failed += 1
+        print("%-8d %10.2f  %s -> %s" % (status, elapsed, blend_path, case_path))
+    print("Exported %d cases (%d failed) in %.2f s" \
+          % (len(jobs), n_failed, time.time() - t0))
+    return n_failed
+
+
+def main(argv):
+    """Parses command line arguments and runs export jobs"""
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Export SnappyHexMesh GUI cases from Blender files " \
+        + "in parallel background Blender processes")
+    parser.add_argument("jobfile", help="File with lines of " \
+                        + "'blend_file case_directory'")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="Number of parallel Blender processes")
+    parser.add_argument("--blender", default="blender",
+                        help="Blender executable")
+    args = parser.parse_args(argv)
+
+    jobs = read_jobs(args.jobfile)
+    if not jobs:
+        print("No jobs found in %r" % args.jobfile)
+        return 0
+    n_failed = run_jobs(jobs, args.blender, max(1, args.jobs))
+    return 1 if n_failed else 0
+
+
+if __name__ == "__main__":
+    if bpy is not None:
+        sys.exit(export_in_blender(sys.argv))
+    sys.exit(main(sys.argv[1:]))
@@ -37,114 +37,235 @@ class OBJECT_OT_snappyhexmeshgui_export(bpy.types.Operator):
         return (ob and ob.type == 'MESH' and context.mode == 'OBJECT')
 
     def execute(self, context):
-        from copy import deepcopy
-        l.debug("Starting export")
-        gui = bpy.context.scene.snappyhexmeshgui
+        export_case(self)
+        return {'FINISHED'}
+
+def export_case(reporter, export_path=None, geometry=None):
+    """Exports OpenFOAM case files for current scene. Messages are
+    reported with reporter.report() (e.g. the calling operator).
+    export_path overrides the Export Path setting if given. geometry
+    is an optional result of an earlier export_geometries() call, in
+    which case those geometry files are linked to the case instead of
+    exporting geometry again. Does not require an active object or UI
+    context, so this can be run also in Blender background mode.
+    Returns number of exported meshes, or zero if export failed.
+    """
+
+    l.debug("Starting export")
+    gui = bpy.context.scene.snappyhexmeshgui
+    if export_path is None:
         export_path = gui.export_path
 
-        # Get snappyHexMeshTemplate file
-        featuresData, blockData, snappyData, \
-            decomposepardictData, createbafflesdictData, \
-            meshqualitydictData = \
-            export_initialize(self, gui.surface_features_template_path, \
-                              gui.block_mesh_template_path, \
-                              gui.snappy_template_path, \
-                              gui.decomposepardict_template_path, \
-                              gui.createbafflesdict_template_path, \
-                              gui.meshqualitydict_template_path, \
-                              export_path)
-        if featuresData is None or blockData is None or snappyData is None \
-           or decomposepardictData is None or createbafflesdictData is None \
-           or meshqualitydictData is None:
-            return{'FINISHED'}
-
-        # Carry out replacements to templates other than snappyHexMeshDict
-        framework = gui.openfoam_framework
-        featuresData = export_surface_features_replacements(featuresData, framework)
-        blockData = export_block_mesh_replacements(blockData, framework)
-        decomposepardictData = export_decomposepardict_replacements(decomposepardictData)
-        createbafflesdictData = export_createbafflesdict_replacements(createbafflesdictData)
-        meshqualitydictData = export_meshqualitydict_replacements(meshqualitydictData)
-
-        # Write surfaceFeaturesDict
-        # openfoam.org uses surfaceFeaturesDict, openfoam.com surfaceFeatureExtract
-        if framework == 'openfoam.org':
-            outfilename = os.path.join(bpy.path.abspath(export_path), \
-                                       'system', 'surfaceFeaturesDict')
-        elif framework == 'openfoam.com':
-            outfilename = os.path.join(bpy.path.abspath(export_path), \
-                                       'system', 'surfaceFeatureExtractDict')
-        else:
-            raise Exception("unknown OpenFOAM framework" + framework)
-
-        outfile = open(outfilename, 'w')
-        outfile.write(''.join(featuresData))
-        outfile.close()
-
-        # Write blockMeshDict
-        if gui.do_block_mesh:
-            outfilename = os.path.join(bpy.path.abspath(export_path), \
-                          'system', 'blockMeshDict')
-            outfile = open(outfilename, 'w')
-            outfile.write(''.join(blockData))
-            outfile.close()
-
-        # Write result to snappyHexMeshDicts
-        dict_numbers = get_dict_numbers()
-        # Always create base snappyHexMeshDict
-        if 1 not in dict_numbers:
-            dict_numbers.append(1)
-        for i in dict_numbers:
-            snappyDataCopy = deepcopy(snappyData)
-            n, snappyDataCopy = export_snappy_replacements(snappyDataCopy, dict_number=i)
-            if n==0:
-                self.report({'ERROR'}, "Can't export object %r " % snappyDataCopy \
-                            + " because it is not visible")
-                return {'FINISHED'}
-
-            snappy_filename = 'snappyHexMeshDict'
-            if i > 1:
-                snappy_filename += str(i)
-            outfilename = os.path.join(bpy.path.abspath(export_path), \
-                                       'system', snappy_filename)
-            outfile = open(outfilename, 'w')
-            outfile.write(''.join(snappyDataCopy))
-            outfile.close()
-
-        # Write decomposeParDict
-        outfilename = os.path.join(bpy.path.abspath(export_path), \
-                                   'system', 'decomposeParDict')
-        outfile = open(outfilename, 'w')
-        outfile.write(''.join(decomposepardictData))
-        outfile.close()
+    # Settings may have been changed by a script (e.g. sweep export)
+    # without a depsgraph update, so don't reuse cached estimates
+    from .op_object import cell_count_estimate_cache
+    cell_count_estimate_cache.clear()
+
+    # Collect export data from all objects in one pass
+    snapshot = get_scene_snapshot()
+    if not snapshot.objects:
+        reporter.report({'ERROR'}, "No mesh objects included in export")
+        return 0
+
+    # Get snappyHexMeshTemplate file
+    featuresData, blockData, snappyData, \
+        decomposepardictData, createbafflesdictData, \
+        meshqualitydictData, controldictData = \
+        export_initialize(reporter, gui.surface_features_template_path, \
+                          gui.block_mesh_template_path, \
+                          gui.snappy_template_path, \
+                          gui.decomposepardict_template_path, \
+                          gui.createbafflesdict_template_path, \
+                          gui.meshqualitydict_template_path, \
+                          gui.controldict_template_path, \
+                          export_path, snapshot)
+    if featuresData is None or blockData is None or snappyData is None \
+       or decomposepardictData is None or createbafflesdictData is None \
+       or meshqualitydictData is None or controldictData is None:
+        return 0
+
+    # Update block mesh dimensions from current global bounds
+    from .op_object import get_global_bbox_coords, block_mesh_cell_count
+    bb_min, bb_max = get_global_bbox_coords()
+    block_mesh_cell_count(bb_min, bb_max, gui)
 
-        # Write createBafflesDict
+    # Carry out replacements to templates other than snappyHexMeshDict
+    framework = gui.openfoam_framework
+    featuresData = export_surface_features_replacements(featuresData, framework, snapshot)
+    blockData = export_block_mesh_replacements(blockData, framework)
+    decomposepardictData = export_decomposepardict_replacements(decomposepardictData, snapshot)
+    createbafflesdictData = export_createbafflesdict_replacements(createbafflesdictData, snapshot)
+    meshqualitydictData = export_meshqualitydict_replacements(meshqualitydictData)
+    controldictData = export_controldict_replacements(controldictData)
+
+    # Export geometry files once. The resulting geometry dictionary
+    # entry is shared by all snappyHexMeshDicts.
+    if geometry is None:
+        geometry = export_geometries(snapshot, export_path)
+    else:
+        link_geometry_files(geometry[2], export_path)
+    n, geo, geo_files = geometry
+    if n==0:
+        reporter.report({'ERROR'}, "Can't export object %r " % geo \
+                        + " because it is not visible")
+        return 0
+    l.debug("Exported geometry files: %r" % geo_files)
+
+    # Carry out replacements to snappyHexMeshDicts
+    dict_numbers = get_dict_numbers(snapshot)
+    # Always create base snappyHexMeshDict
+    if 1 not in dict_numbers:
+        dict_numbers.append(1)
+    snappy_values = export_snappy_common_values(geo, snapshot)
+    snappyDatas = []
+    for i in dict_numbers:
+        snappyDataCopy = export_snappy_replacements(snappyData, snappy_values, snapshot, dict_number=i)
+        snappyDatas.append((i, snappyDataCopy))
+
+    # Don't write any case files if templates contain key words
+    # without a value (e.g. a typo in a custom template)
+    unfilled = get_unfilled_template_keys()
+    if unfilled:
+        reporter.report({'ERROR'}, "Unknown template key words: " \
+                        + ", ".join(unfilled) + ". Case files were " \
+                        + "not written")
+        return 0
+
+    # Write surfaceFeaturesDict
+    # openfoam.org uses surfaceFeaturesDict, openfoam.com surfaceFeatureExtract
+    if framework == 'openfoam.org':
+        outfilename = os.path.join(bpy.path.abspath(export_path), \
+                                   'system', 'surfaceFeaturesDict')
+    elif framework == 'openfoam.com':
         outfilename = os.path.join(bpy.path.abspath(export_path), \
-                                   'system', 'createBafflesDict')
-        outfile = open(outfilename, 'w')
-        outfile.write(''.join(createbafflesdictData))
-        outfile.close()
+                                   'system', 'surfaceFeatureExtractDict')
+    else:
+        raise Exception("unknown OpenFOAM framework" + framework)
 
-        # Write meshQualityDict
+    write_case_file(outfilename, featuresData)
+
+    # Write blockMeshDict
+    if gui.do_block_mesh:
+        outfilename = os.path.join(bpy.path.abspath(export_path), \
+                      'system', 'blockMeshDict')
+        write_case_file(outfilename, blockData)
+
+    # Write result to snappyHexMeshDicts
+    for i, snappyDataCopy in snappyDatas:
+        snappy_filename = 'snappyHexMeshDict'
+        if i > 1:
+            snappy_filename += str(i)
         outfilename = os.path.join(bpy.path.abspath(export_path), \
-                                   'system', 'meshQualityDict')
-        outfile = open(outfilename, 'w')
-        outfile.write(''.join(meshqualitydictData))
-        outfile.close()
+                                   'system', snappy_filename)
+        write_case_file(outfilename, snappyDataCopy)
+
+    # Write decomposeParDict
+    outfilename = os.path.join(bpy.path.abspath(export_path), \
+                               'system', 'decomposeParDict')
+    write_case_file(outfilename, decomposepardictData)
+
+    # Write createBafflesDict
+    outfilename = os.path.join(bpy.path.abspath(export_path), \
+                               'system', 'createBafflesDict')
+    write_case_file(outfilename, createbafflesdictData)
+
+    # Write meshQualityDict
+    outfilename = os.path.join(bpy.path.abspath(export_path), \
+                               'system', 'meshQualityDict')
+    write_case_file(outfilename, meshqualitydictData)
+
+    # Write controlDict. Existing controlDict may contain user edits
+    # (e.g. functions or write settings), so it is kept unless update
+    # is requested.
+    outfilename = os.path.join(bpy.path.abspath(export_path), \
+                               'system', 'controlDict')
+    if gui.update_controldict or not os.path.isfile(outfilename):
+        write_case_file(outfilename, controldictData)
+    else:
+        l.debug("Kept existing controlDict %r" % outfilename)
+
+    from .op_object import get_resource_plan_warning
+    plan_warning = get_resource_plan_warning(bpy.context.scene)
+    if plan_warning:
+        reporter.report({'WARNING'}, plan_warning)
 
-        self.report({'INFO'}, "Exported %d meshes " % n \
+    reporter.report({'INFO'}, "Exported %d meshes " % n \
                     + "to: %r" % export_path)
-        return {'FINISHED'}
+    return n
 
-def get_dict_numbers():
-    """Return list of dict numbers for layer addition"""
+# Object properties which are copied to ObjectRecord
+OBJECT_RECORD_PROPERTIES = (
+    "shmg_include_snapping",
+    "shmg_include_feature_extraction",
+    "shmg_surface_min_level",
+    "shmg_surface_max_level",
+    "shmg_feature_edge_level",
+    "shmg_surface_layers",
+    "shmg_dict_number",
+    "shmg_patch_info_type",
+    "shmg_face_zone_type",
+    "shmg_cell_zone_type",
+    "shmg_volume_level",
+    "shmg_volume_type",
+    "shmg_slave_side_layers",
+    "shmg_specify_object_layer_properties",
+    "shmg_obj_surface_layer_expansion_ratio",
+    "shmg_obj_surface_layer_final_thickness",
+    "shmg_obj_surface_layer_minimum_thickness",
+    "shmg_buffer_layer",
+)
+
+class ObjectRecord:
+    """Snapshot of export settings of a mesh object included in export.
+    Object settings are available as attributes with the same names as
+    the object properties.
+    """
 
-    dict_numbers = []
-    for i in bpy.data.objects:
-        if i.type != 'MESH':
+    __slots__ = ('obj', 'name', 'is_emesh', 'has_emesh_pair') \
+        + OBJECT_RECORD_PROPERTIES
+
+    def __init__(self, obj, names):
+        self.obj = obj
+        self.name = obj.name
+        self.is_emesh = obj.name.endswith("_eMesh")
+        self.has_emesh_pair = (obj.name + "_eMesh") in names
+        for prop in OBJECT_RECORD_PROPERTIES:
+            setattr(self, prop, getattr(obj, prop))
+
+class SceneSnapshot:
+    """Snapshot of export data of all objects, collected in one pass over
+    objects. objects contains ObjectRecords of mesh objects included in
+    export, and locations contains tuples of name and location of
+    Location In Mesh objects.
+    """
+
+    __slots__ = ('objects', 'locations')
+
+    def __init__(self):
+        self.objects = []
+        self.locations = []
+
+def get_scene_snapshot():
+    """Returns SceneSnapshot of current Blender data"""
+
+    snapshot = SceneSnapshot()
+    names = set(bpy.data.objects.keys())
+    for ob in bpy.data.objects:
+        if ob.type == 'EMPTY' and ob.name.startswith("Location In Mesh"):
+            snapshot.locations.append((ob.name, ob.location.copy()))
+            continue
+        if ob.type != 'MESH':
             continue
-        if not i.shmg_include_in_export:
+        if not ob.shmg_include_in_export:
             continue
+        snapshot.objects.append(ObjectRecord(ob, names))
+    return snapshot
+
+def get_dict_numbers(snapshot):
+    """Return list of dict numbers for layer addition"""
+
+    dict_numbers = []
+    for i in snapshot.objects:
         if i.shmg_surface_layers == -1:
             continue
         if i.shmg_dict_number in dict_numbers:
@@ -158,60 +279,67 @@ def export_initialize(self, surface_features_template_path, \
                       decomposepardict_template_path, \
                       createbafflesdict_template_path, \
                       meshqualitydict_template_path, \
-                      export_path):
-    """Initialization routine. Reads contents of
+                      controldict_template_path, \
+                      export_path, snapshot):
+    """Initialization routine. Reads and compiles
     surfaceFeaturesDictTemplate, blockMeshDictTemplate,
-    snappyHexMeshDictTemplate and decomposeParDict files as text
-    strings and creates directory structure undex export path if
-    needed.
+    snappyHexMeshDictTemplate, decomposeParDict, createBafflesDict,
+    meshQualityDict and controlDict template files
+    and creates directory structure undex export path if needed.
     """
 
     abspath = bpy.path.abspath(export_path)
     if not abspath:
         self.report({'ERROR'}, "No path set! Please save Blender file to "
                     "a case folder and try again")
-        return None, None, None, None, None, None
+        return None, None, None, None, None, None, None
     l.debug("Export path: %r" % abspath)
 
     l.debug("snappyHexMeshTemplate path: %r" % snappy_template_path)
     if not (os.path.isfile(snappy_template_path)):
         self.report({'ERROR'}, "Template not found: %r" \
                     % snappy_template_path)
-        return None, None, None, None, None, None
+        return None, None, None, None, None, None, None
     
     l.debug("blockMeshTemplate path: %r" % block_mesh_template_path)
     if not (os.path.isfile(block_mesh_template_path)):
         self.report({'ERROR'}, "Template not found: %r" \
                     % block_mesh_template_path)
-        return None, None, None, None, None, None
+        return None, None, None, None, None, None, None
 
     l.debug("surfaceFeaturesDictTemplate path: %r" % surface_features_template_path)
     if not (os.path.isfile(surface_features_template_path)):
         self.report({'ERROR'}, "Template not found: %r" \
                     % surface_features_template_path)
-        return None, None, None, None, None, None
+        return None, None, None, None, None, None, None
 
     l.debug("decomposeParDictTemplate path: %r" % decomposepardict_template_path)
     if not (os.path.isfile(decomposepardict_template_path)):
         self.report({'ERROR'}, "Template not found: %r" \
                     % decomposepardict_template_path)
-        return None, None, None, None, None, None
+        return None, None, None, None, None, None, None
 
     l.debug("createBafflesParDictTemplate path: %r" % createbafflesdict_template_path)
     if not (os.path.isfile(createbafflesdict_template_path)):
         self.report({'ERROR'}, "Template not found: %r" \
                     % createbafflesdict_template_path)
-        return None, None, None, None, None, None
+        return None, None, None, None, None, None, None
 
     l.debug("meshQualityDictTemplate path: %r" % meshqualitydict_template_path)
     if not (os.path.isfile(meshqualitydict_template_path)):
         self.report({'ERROR'}, "Template not found: %r" \
                     % meshqualitydict_template_path)
-        return None, None, None, None, None, None
+        return None, None, None, None, None, None, None
+
+    l.debug("controlDictTemplate path: %r" % controldict_template_path)
+    if not (os.path.isfile(controldict_template_path)):
+        self.report({'ERROR'}, "Template not found: %r" \
+                    % controldict_template_path)
+        return None, None, None, None, None, None, None
 
     # Create folder structure if needed
     if not (os.path.isdir(abspath)):
-        os.mkdir(abspath)
+        os.makedirs(abspath)
 
     for p in ['constant', 'system']:
         if not (os.path.isdir(os.path.join(abspath, p))):
@@ -222,56 +350,123 @@ def export_initialize(self, surface_features_template_path, \
 
     if not (os.path.isdir(os.path.join(abspath, 'system'))):
         self.report({'ERROR'}, "Couldn't create folders under %r" % abspath)
-        return None, None, None, None, None, None
+        return None, None, None, None, None, None, None
 
     # Copy skeleton files if needed
-    copy_skeleton_files()
+    copy_skeleton_files(abspath)
     
-    with open(snappy_template_path, 'r') as infile:
-        snappyData = infile.readlines()
-
-    with open(block_mesh_template_path, 'r') as infile:
-        blockData = infile.readlines()
-
-    with open(surface_features_template_path, 'r') as infile:
-        featuresData = infile.readlines()
-
-    with open(decomposepardict_template_path, 'r') as infile:
-        decomposepardictData = infile.readlines()
-
-    with open(createbafflesdict_template_path, 'r') as infile:
-        createbafflesdictData = infile.readlines()
+    unfilled_template_keys.clear()
+    snappyData = get_template(snappy_template_path)
+    blockData = get_template(block_mesh_template_path)
+    featuresData = get_template(surface_features_template_path)
+    decomposepardictData = get_template(decomposepardict_template_path)
+    createbafflesdictData = get_template(createbafflesdict_template_path)
+    controldictData = get_template(controldict_template_path)
 
     # Use disabled mesh quality dict if quality criteria are to be
     # disabled, and normal template otherwise
     gui = bpy.context.scene.snappyhexmeshgui
     if gui.disable_quality_criteria:
         file_path=os.path.join(os.path.dirname(__file__), 'skel', 'disabledMeshQualityDict')
-        with open(file_path, 'r') as infile:
-            meshqualitydictData = infile.readlines()
+        meshqualitydictData = get_template(file_path)
     else:
-        with open(meshqualitydict_template_path, 'r') as infile:
-            meshqualitydictData = infile.readlines()
+        meshqualitydictData = get_template(meshqualitydict_template_path)
 
-    create_run(abspath)
+    create_run(abspath, snapshot)
 
     return featuresData, blockData, snappyData, decomposepardictData, \
-        createbafflesdictData, meshqualitydictData
+        createbafflesdictData, meshqualitydictData, controldictData
 
     
-def subst_value(keystr, val, data):
-    """Substitute keystr (key word string) with val in 
-    snappyHexMesh template data. keystr is the text in
-    "//_TEXT_//" clauses in data.
+# Regular expression matching key word slots "//_KEY_//" in templates
+TEMPLATE_KEY_RE = re.compile(r'//_([A-Z0-9_]+)_//')
+
+class CompiledTemplate:
+    """Template text compiled to a list of alternating literal text
+    segments and key word slot names. Key words are the TEXT parts of
+    "//_TEXT_//" clauses in the template.
+    """
+
+    __slots__ = ('path', 'segments', 'keys')
+
+    def __init__(self, text, path=""):
+        self.path = path
+        # Odd items are key words, even items are literal text
+        self.segments = TEMPLATE_KEY_RE.split(text)
+        self.keys = frozenset(self.segments[1::2])
+
+    def render(self, values):
+        """Returns template text with key word slots substituted with
+        text strings from dictionary values. Template key words are
+        validated against values before substitution. Key words without
+        a value are recorded to unfilled_template_keys and their slots
+        are left untouched.
+        """
+
+        missing = self.keys.difference(values)
+        if missing:
+            l.debug("Template %r has key words without a value: %r" \
+                    % (self.path, sorted(missing)))
+            unfilled_template_keys.update(missing)
+        parts = self.segments[:]
+        for i in range(1, len(parts), 2):
+            key = parts[i]
+            if key in missing:
+                parts[i] = '//_' + key + '_//'
+            else:
+                parts[i] = values[key]
+        return ''.join(parts)
+
+# Cache of compiled templates. Key is template path, value is a tuple
+# of file modification time and compiled template.
+template_cache = dict()
+
+# Key words found in templates without a value in latest export
+unfilled_template_keys = set()
+
+def get_template(path):
+    """Returns compiled template for template file path. Compiled
+    templates are cached until the template file is modified.
+    """
+
+    mtime = os.path.getmtime(path)
+    cached = template_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'r') as infile:
+        template = CompiledTemplate(infile.read(), path)
+    l.debug("Compiled template %r with key words %r" \
+            % (path, sorted(template.keys)))
+    template_cache[path] = (mtime, template)
+    return template
+
+def get_unfilled_template_keys():
+    """Returns sorted list of template key words which were without
+    a value in latest export
     """
 
-    restr = '//_' + keystr.upper() + '_//'
-    newdata = []
-    for line in data:
-        newdata.append(line.replace(restr, val))
-    return newdata
+    return sorted(unfilled_template_keys)
 
 
+def write_case_file(filename, text):
+    """Writes text to case file filename, unless the file already has
+    the same contents apart from the export date. Unchanged files keep
+    their modification time, so make based runs don't rerun steps which
+    use them.
+    """
+
+    def strip_date(t):
+        return [line for line in t.splitlines() \
+                if not line.startswith("// Export date:")]
+
+    if os.path.isfile(filename):
+        with open(filename, 'r') as infile:
+            if strip_date(infile.read()) == strip_date(text):
+                return
+    with open(filename, 'w') as outfile:
+        outfile.write(text)
+
 def get_header_text():
     """Returns dictionary header comment text"""
     import datetime
@@ -279,89 +474,199 @@ def get_header_text():
         + "\n// Source file: " + bpy.context.blend_data.filepath \
         + "\n// Export date: " + str(datetime.datetime.now())
 
-def export_surface_features_replacements(data, framework):
-	
+def export_surface_features_replacements(template, framework, snapshot):
     """Carry out replacements for key words in surfaceFeaturesDictTemplate with
     settings from GUI.
     """
-    data = subst_value("HEADER", get_header_text(), data)
+
+    from .op_object import FEATURE_INCLUDED_ANGLE
+    angle = "%g" % FEATURE_INCLUDED_ANGLE
+
     # List all mesh object STL names included in export
     d=''
-    for i in bpy.data.objects:
-        if i.type != 'MESH':
-            continue
-        if not i.shmg_include_in_export:
-            continue
+    for i in snapshot.objects:
         if not i.shmg_include_feature_extraction:
             continue
-        if i.name.endswith("_eMesh"):
+        if i.is_emesh:
             continue
-        if (i.name + "_eMesh") in bpy.data.objects:
+        if i.has_emesh_pair:
             continue
-	
+
         if framework == 'openfoam.org':
             d += "    \"%s.stl\"\n" % i.name
         elif framework == 'openfoam.com':
-            d += "%s.stl\n{\n    extractionMethod extractFromSurface;\n    extractFromSurfaceCoeffs { includedAngle 150; }\n    writeObj yes;\n}\n\n" % i.name
+            d += "%s.stl\n{\n    extractionMethod extractFromSurface;\n    extractFromSurfaceCoeffs { includedAngle %s; }\n    writeObj yes;\n}\n\n" % (i.name, angle)
     if framework == 'openfoam.org':
-        data = subst_value("FEATURESURFACES", "\nsurfaces\n(\n" + d + \
-                           ");\n\nincludedAngle 150;\nwriteObj yes;\n", data)
-    else:
-        data = subst_value("FEATURESURFACES", d, data)
-		
-    return data
+        d = "\nsurfaces\n(\n" + d + ");\n\nincludedAngle " + angle + ";\nwriteObj yes;\n"
 
-def export_block_mesh_replacements(data, framework):
+    return template.render({
+        "HEADER": get_header_text(),
+        "FEATURESURFACES": d,
+    })
+
+def export_block_mesh_replacements(template, framework):
     """Carry out replacements for key words in blockMeshDictTemplate with
     settings from GUI.
     """
 
     gui = bpy.context.scene.snappyhexmeshgui
 
-    data = subst_value("HEADER", get_header_text(), data)
-
     if framework == 'openfoam.org':
         scale_command = "convertToMeters"
     elif framework == 'openfoam.com':
         scale_command = "scale"
-    data = subst_value("EXPORT_SCALE_COMMAND", scale_command, data)
-    data = subst_value("EXPORT_SCALE", "%.6g" % gui.export_scale, data)
 
-    data = subst_value("DX", str(gui.block_mesh_delta[0]), data)
-    data = subst_value("DY", str(gui.block_mesh_delta[1]), data)
-    data = subst_value("DZ", str(gui.block_mesh_delta[2]), data)
+    return template.render({
+        "HEADER": get_header_text(),
+        "EXPORT_SCALE_COMMAND": scale_command,
+        "EXPORT_SCALE": "%.6g" % gui.export_scale,
+        "DX": str(gui.block_mesh_delta[0]),
+        "DY": str(gui.block_mesh_delta[1]),
+        "DZ": str(gui.block_mesh_delta[2]),
+        "XMIN": "%.6g" % gui.block_mesh_min[0],
+        "YMIN": "%.6g" % gui.block_mesh_min[1],
+        "ZMIN": "%.6g" % gui.block_mesh_min[2],
+        "XMAX": "%.6g" % gui.block_mesh_max[0],
+        "YMAX": "%.6g" % gui.block_mesh_max[1],
+        "ZMAX": "%.6g" % gui.block_mesh_max[2],
+    })
+
+def export_decomposepardict_replacements(template, snapshot):
+    """Carry out replacements for decomposeParDict."""
 
-    data = subst_value("XMIN", "%.6g" % gui.block_mesh_min[0], data)
-    data = subst_value("YMIN", "%.6g" % gui.block_mesh_min[1], data)
-    data = subst_value("ZMIN", "%.6g" % gui.block_mesh_min[2], data)
+    from .op_object import get_number_of_cpus
+    n_cpus = get_number_of_cpus(bpy.context.scene)
+    method, n, levels = get_decomposition(n_cpus, snapshot)
+
+    multilevel = ""
+    if levels:
+        multilevel = "multiLevelCoeffs\n{\n"
+        for i, n_level in enumerate(levels):
+            multilevel += "    level%d\n    {\n" % i \
+                + "        numberOfSubdomains %d;\n" % n_level \
+                + "        method          scotch;\n    }\n"
+        multilevel += "}\n"
+
+    return template.render({
+        "HEADER": get_header_text(),
+        "NCPUS": str(n_cpus),
+        "DECOMPOSITION_METHOD": method,
+        "HIERARCHICAL_N": "%d %d %d" % tuple(n),
+        "MULTILEVEL_COEFFS": multilevel,
+    })
+
+def get_decomposition(n_cpus, snapshot):
+    """Returns decomposition method name, hierarchical subdomain counts
+    (nx, ny, nz) and list of multiLevel subdomain counts per level
+    (empty unless method is multiLevel) for n_cpus subdomains.
+
+    In automatic mode, multiLevel (nodes, cores per node) is used when
+    the run spans several nodes. Otherwise hierarchical decomposition
+    is used if refinement is either minor or spread over the whole
+    domain, because then the geometric split balances well and gives
+    the smallest processor interfaces. scotch is used when refinement
+    is concentrated on a part of the domain.
+    """
 
-    data = subst_value("XMAX", "%.6g" % gui.block_mesh_max[0], data)
-    data = subst_value("YMAX", "%.6g" % gui.block_mesh_max[1], data)
-    data = subst_value("ZMAX", "%.6g" % gui.block_mesh_max[2], data)
+    gui = bpy.context.scene.snappyhexmeshgui
+    n = get_balanced_factorization(n_cpus, gui.block_mesh_delta)
+    method = gui.decomposition_method
+    nodes = 0
+    if gui.cores_per_node > 0 and n_cpus > gui.cores_per_node \
+       and n_cpus % gui.cores_per_node == 0:
+        nodes = n_cpus // gui.cores_per_node
+
+    if method == 'auto':
+        if n_cpus == 1:
+            method = 'scotch'
+        elif nodes > 1:
+            method = 'multiLevel'
+        elif is_refinement_spread(snapshot):
+            method = 'hierarchical'
+        else:
+            method = 'scotch'
 
-    return data
+    levels = []
+    if method == 'multiLevel':
+        if nodes > 1:
+            levels = [nodes, gui.cores_per_node]
+        else:
+            levels = [n_cpus]
+    return method, n, levels
 
-def export_decomposepardict_replacements(data):
-    """Carry out replacements for decomposeParDict."""
+def get_balanced_factorization(n_cpus, lengths):
+    """Returns subdomain counts (nx, ny, nz) with product n_cpus, which
+    minimize the total processor interface area for a box with side
+    lengths (or cell counts) lengths
+    """
 
-    gui = bpy.context.scene.snappyhexmeshgui
-    data = subst_value("HEADER", get_header_text(), data)
-    data = subst_value("NCPUS", str(gui.number_of_cpus), data)
-    return data
+    lx, ly, lz = [max(1, v) for v in lengths]
+    best = None
+    for nx in range(1, n_cpus + 1):
+        if n_cpus % nx != 0:
+            continue
+        for ny in range(1, n_cpus // nx + 1):
+            if (n_cpus // nx) % ny != 0:
+                continue
+            nz = n_cpus // nx // ny
+            area = (nx - 1) * ly * lz + (ny - 1) * lx * lz \
+                + (nz - 1) * lx * ly
+            if best is None or area < best[0]:
+                best = (area, (nx, ny, nz))
+    return best[1]
+
+def is_refinement_spread(snapshot):
+    """Returns True if refinement is minor compared to the background
+    mesh, or if refined objects cover most of the global bounding box
+    along each axis
+    """
 
-def export_createbafflesdict_replacements(data):
+    from .op_object import get_cached_global_bbox_coords, \
+        get_cached_cell_count_estimate, get_block_mesh_cell_count, \
+        get_object_bbox_coords
+
+    scene = bpy.context.scene
+    gui = scene.snappyhexmeshgui
+    bb_min, bb_max = get_cached_global_bbox_coords(scene)
+    if not bb_min:
+        return True
+    n_background = get_block_mesh_cell_count(bb_min, bb_max,
+                                             gui.cell_side_length)
+    n_castellated = get_cached_cell_count_estimate(scene)[0]
+    if n_castellated < 2 * n_background:
+        return True
+
+    refined_mins = []
+    refined_maxs = []
+    for i in snapshot.objects:
+        if i.is_emesh:
+            continue
+        if i.shmg_volume_type == 'outside':
+            return True
+        if i.shmg_surface_max_level > 0 or i.shmg_volume_level > 0 \
+           or i.shmg_feature_edge_level > 0:
+            obj_min, obj_max = get_object_bbox_coords(i.obj)
+            refined_mins.append(obj_min)
+            refined_maxs.append(obj_max)
+    if not refined_mins:
+        return True
+
+    for k in range(3):
+        extent = bb_max[k] - bb_min[k]
+        refined = max(c[k] for c in refined_maxs) \
+            - min(c[k] for c in refined_mins)
+        if extent > 0.0 and refined < 0.8 * extent:
+            return False
+    return True
+
+def export_createbafflesdict_replacements(template, snapshot):
     """Carry out replacements for createBafflesDict."""
 
-    data = subst_value("HEADER", get_header_text(), data)
     d=''
-    for i in bpy.data.objects:
-        if i.type != 'MESH':
-            continue
-        if not i.shmg_include_in_export:
-            continue
+    for i in snapshot.objects:
         if i.shmg_face_zone_type != 'internal':
             continue
-        if i.name.endswith("_eMesh"):
+        if i.is_emesh:
             continue
 
         # Add entries of this object to createBafflesDict
@@ -381,147 +686,222 @@ def export_createbafflesdict_replacements(data):
              + "        }\n" \
              + "    }\n\n"
 
-    data = subst_value("BAFFLE_ENTRIES", d, data)
-    return data
+    return template.render({
+        "HEADER": get_header_text(),
+        "BAFFLE_ENTRIES": d,
+    })
+
+def export_controldict_replacements(template):
+    """Carry out replacements for controlDict."""
 
-def export_meshqualitydict_replacements(data):
+    gui = bpy.context.scene.snappyhexmeshgui
+    file_handler = ""
+    if gui.collated_file_handler:
+        file_handler = "OptimisationSwitches\n{\n" \
+            + "    fileHandler     collated;\n}\n"
+    functions = ""
+    if gui.write_diagnostic_fields:
+        functions = "    // Write cell center coordinates and cell volume " \
+            + "as fields by running\n    // postProcess -time '1:'\n" \
+            + "    #includeFunc writeCellCentres\n" \
+            + "    #includeFunc writeCellVolumes"
+    return template.render({
+        "HEADER": get_header_text(),
+        "FILE_HANDLER": file_handler,
+        "WRITE_FORMAT": gui.write_format,
+        "WRITE_COMPRESSION": "on" if gui.write_compression else "off",
+        "FUNCTIONS": functions,
+    })
+
+def export_meshqualitydict_replacements(template):
     """Carry out replacements for meshQualityDict."""
 
     gui = bpy.context.scene.snappyhexmeshgui
-    header_text = get_header_text()
-    data = subst_value("HEADER", header_text, data)
-    data = subst_value("MAX_NON_ORTHO", str(gui.max_non_ortho), data)
-    data = subst_value("MAX_INTERNAL_SKEWNESS", str(gui.max_internal_skewness), data)
-    data = subst_value("RELAXED_MAX_NON_ORTHO", str(gui.relaxed_max_non_ortho), data)
-    data = subst_value("MIN_TWIST", "%g" % gui.min_twist, data)
-    # Disabled relaxed min triangle twist for now. It does not seem to
-    # play much role for layer addition.
-    # data = subst_value("RELAXED_MIN_TWIST", "%g" % gui.relaxed_min_twist, data)
-
-    return data
-
-def export_snappy_replacements(data, dict_number):
-    """Carry out replacements for key words in snappyHexMeshTemplate with
-    settings from GUI. If second_add_layers is True, then this function
-    creates the contents for Additional Layers Phase only.
+    return template.render({
+        "HEADER": get_header_text(),
+        "MAX_NON_ORTHO": str(gui.max_non_ortho),
+        "MAX_INTERNAL_SKEWNESS": str(gui.max_internal_skewness),
+        "RELAXED_MAX_NON_ORTHO": str(gui.relaxed_max_non_ortho),
+        "MIN_TWIST": "%g" % gui.min_twist,
+        # Disabled relaxed min triangle twist for now. It does not seem to
+        # play much role for layer addition.
+        # "RELAXED_MIN_TWIST": "%g" % gui.relaxed_min_twist,
+    })
+
+def export_snappy_common_values(geo, snapshot):
+    """Returns dictionary of key word values for snappyHexMeshTemplate
+    which are common to all snappyHexMeshDicts. geo is the geometry
+    dictionary entry created by export_geometries() and snapshot is
+    the SceneSnapshot of export data.
     """
-    
+
+    from .op_object import get_resource_plan
     gui = bpy.context.scene.snappyhexmeshgui
     framework = gui.openfoam_framework
+    max_local_cells, max_global_cells = \
+        get_resource_plan(bpy.context.scene)[1:]
+
+    values = {
+        "HEADER": get_header_text(),
+        "CELL_COUNT_ESTIMATE": get_cell_count_estimate_text(snapshot),
+        "MAX_LOCAL_CELLS": str(max_local_cells),
+        "MAX_GLOBAL_CELLS": str(max_global_cells),
+        "GEOMETRY": geo,
+        "FEATURES": export_surface_features(snapshot),
+        "REFINEMENTSURFACES": export_refinement_surfaces(snapshot),
+        "REFINEMENTREGIONS": export_refinement_volumes(snapshot),
+        "LOCATIONINMESH": get_location_in_mesh(snapshot),
+        "LAYER_FEATURE_ANGLE": "%g" % gui.surface_layer_feature_angle,
+        # Disabled variable nSmoothSurfaceNormals for now
+        # "NSMOOTH_SURFACE_NORMALS": str(get_nsmooth_surface_normals(snapshot)),
+        "FEATURE_SNAP_ITER": str(gui.feature_snap_iter),
+        "EXPANSION_RATIO": "%g" % gui.surface_layer_expansion_ratio,
+        "FINAL_THICKNESS": "%g" % gui.surface_layer_final_thickness,
+        "MIN_THICKNESS": "%g" % gui.surface_layer_minimum_thickness,
+        # Disable variable nOuterIter for now
+        # "SHRINKING_OUTER_ITER": str(get_shrinking_outer_iter(snapshot)),
+    }
 
-    data = subst_value("HEADER", get_header_text(), data)
-    
-    if dict_number == 1:
-        data = subst_value("DO_CASTELLATION", str(gui.do_castellation).lower(), data)
-        data = subst_value("DO_SNAP", str(gui.do_snapping).lower(), data)
-        if not gui.do_add_layers:
-            data = subst_value("DO_ADD_LAYERS", "false", data)
-        elif 1 in get_dict_numbers():
-            data = subst_value("DO_ADD_LAYERS", "true", data)
-        else:
-            data = subst_value("DO_ADD_LAYERS", "false", data)
+    if framework == 'openfoam.org':
+        values["ANGLE"] = "minMedianAxisAngle"
     else:
-        data = subst_value("DO_CASTELLATION", "false", data)
-        data = subst_value("DO_SNAP", "false", data)
-        data = subst_value("DO_ADD_LAYERS", "true", data)
+        values["ANGLE"] = "minMedialAxisAngle"
 
-    n, geo = export_geometries()
-    if n==0:
-        return n, geo
+    return values
 
-    data = subst_value("GEOMETRY", geo, data)
+def get_cell_count_estimate_text(snapshot):
+    """Returns comment lines of estimated castellated and final cell
+    counts per object and in total for snappyHexMeshDict
+    """
 
-    data = subst_value("FEATURES", export_surface_features(), data)
-    data = subst_value("REFINEMENTSURFACES", export_refinement_surfaces(), data)
-    data = subst_value("REFINEMENTREGIONS", export_refinement_volumes(), data)
-    data = subst_value("LAYERS", export_surface_layers(dict_number), data)
-    
-    data = subst_value("LOCATIONINMESH", get_location_in_mesh(), data)
+    from .op_object import get_cached_global_bbox_coords, \
+        estimate_cell_counts
+    scene = bpy.context.scene
+    items = [(i, i.obj) for i in snapshot.objects if not i.is_emesh]
+    if not items:
+        return ""
+    bb_min, bb_max = get_cached_global_bbox_coords(scene)
+    castellated, final, total_castellated, total_final = \
+        estimate_cell_counts(scene.snappyhexmeshgui, items, bb_min, bb_max)
+
+    d = "// Estimated cell counts (castellated / final with layers):\n"
+    for (i, obj), nc, nf in zip(items, castellated, final):
+        d += "//     %-30s +%d / +%d\n" % (i.name, nc, nf)
+    d += "//     %-30s %d / %d\n" % ("Total", total_castellated, total_final)
+    return d
 
-    data = subst_value("LAYER_FEATURE_ANGLE", "%g" % gui.surface_layer_feature_angle, data)
-    # Disabled variable nSmoothSurfaceNormals for now
-    # data = subst_value("NSMOOTH_SURFACE_NORMALS", str(get_nsmooth_surface_normals()), data)
-    data = subst_value("FEATURE_SNAP_ITER", str(gui.feature_snap_iter), data)
+def export_snappy_replacements(template, common_values, snapshot, dict_number):
+    """Carry out replacements for key words in snappyHexMeshTemplate with
+    settings from GUI. common_values is the dictionary created by
+    export_snappy_common_values(). If dict_number is larger than one,
+    then this function creates the contents for Additional Layers
+    Phase only.
+    """
 
-    data = subst_value("EXPANSION_RATIO", "%g" % gui.surface_layer_expansion_ratio, data)
-    data = subst_value("FINAL_THICKNESS", "%g" % gui.surface_layer_final_thickness, data)
-    data = subst_value("MIN_THICKNESS", "%g" % gui.surface_layer_minimum_thickness, data)
-    # Disable variable nOuterIter for now
-    # data = subst_value("SHRINKING_OUTER_ITER", str(get_shrinking_outer_iter()), data)
+    gui = bpy.context.scene.snappyhexmeshgui
+    values = dict(common_values)
 
-    if framework == 'openfoam.org':
-        data = subst_value("ANGLE","minMedianAxisAngle",data)
+    if dict_number == 1:
+        values["DO_CASTELLATION"] = str(gui.do_castellation).lower()
+        values["DO_SNAP"] = str(gui.do_snapping).lower()
+        if not gui.do_add_layers:
+            values["DO_ADD_LAYERS"] = "false"
+        elif 1 in get_dict_numbers(snapshot):
+            values["DO_ADD_LAYERS"] = "true"
+        else:
+            values["DO_ADD_LAYERS"] = "false"
     else:
-        data = subst_value("ANGLE","minMedialAxisAngle",data)
+        values["DO_CASTELLATION"] = "false"
+        values["DO_SNAP"] = "false"
+        values["DO_ADD_LAYERS"] = "true"
+
+    values["LAYERS"] = export_surface_layers(snapshot, dict_number)
 
-    return n, data
+    return template.render(values)
 
-def get_max_number_of_layers():
+def get_max_number_of_layers(snapshot):
     """Help function to calculate maximum number of layers.
     """
 
     max_value = 0;
-    for i in bpy.data.objects:
-        if i.type != 'MESH':
-            continue
-        if not i.shmg_include_in_export:
-            continue
+    for i in snapshot.objects:
         if i.shmg_surface_layers > max_value:
             max_value = i.shmg_surface_layers
     return max_value
 
-def get_nsmooth_surface_normals():
+def get_nsmooth_surface_normals(snapshot):
     """Calculates a value for nSmoothSurfaceNormals for layer addition phase.
     Looks like 3 times number of maximum layers works nicely.
     """
 
-    max_value = get_max_number_of_layers()
+    max_value = get_max_number_of_layers(snapshot)
     return (3 * max_value)
 
-def get_shrinking_outer_iter():
+def get_shrinking_outer_iter(snapshot):
     """Calculates a value for nOuterIter for layer addition phase.
     """
 
     from math import ceil
     # Maximum number of layers seems to give best layer coverage
-    max_value = get_max_number_of_layers()
+    max_value = get_max_number_of_layers(snapshot)
     return max_value
 
-def export_geometries():
+def export_geometries(snapshot, export_path):
     """Creates geometry entries for snappyHexMeshDict and
     exports meshes in STL format to case/constant/triSurface folder.
-    Returns number of exported meshes and the dictionary text string.
+    This is done only once per export, the dictionary text string is
+    shared by all snappyHexMeshDicts. Returns number of exported meshes,
+    the dictionary text string and list of exported file paths.
     """
 
     gui = bpy.context.scene.snappyhexmeshgui
-    from .op_object import get_object_bbox_coords, get_surface_area
+    from .op_object import get_object_bbox_coords, get_instance_area, \
+        evaluate_mesh_data, get_mesh_data_key, get_mesh_edge_arrays, \
+        get_transformed_coords, get_array_digest
 
     n = 0 # Number of exported geometries
+    files = [] # Paths of exported geometry files
     # Collect dictionary string to d
     d = "geometry\n{\n"
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    # Apply also scene unit scale, like Blender STL exporters do
+    scale = gui.export_scale * bpy.context.scene.unit_settings.scale_length
 
-    # First deselect every object, since STL export is done by selection
-    for i in bpy.data.objects:
-        i.select_set(False)
-
-    for i in bpy.data.objects:
-        if i.type != 'MESH':
-            continue
-        if not i.shmg_include_in_export:
-            continue
+    # Manifest of fingerprints of previously exported geometry files
+    # is used to skip writing of unchanged files
+    abspath = bpy.path.abspath(export_path)
+    manifest_path = os.path.join(abspath, 'constant', 'triSurface', \
+                                 GEOMETRY_MANIFEST_NAME)
+    old_manifest = read_geometry_manifest(manifest_path)
+    manifest = dict()
+    n_skipped = 0
+    # Mesh data evaluated in this export, see get_mesh_data_key()
+    export_mesh_data = dict()
+
+    for rec in snapshot.objects:
+        i = rec.obj
         # Return error if object is not visible (it can't be exported)
         if not i.visible_get():
-            return 0, i.name
-
-        # Collect mesh min and max bounds and area to info string
-        bb_min, bb_max = get_object_bbox_coords(i)
-        bb_min_str = "        // Min Bounds = [%12.5e %12.5e %12.5e]\n" % (bb_min[0], bb_min[1], bb_min[2])
-        bb_max_str = "        // Max Bounds = [%12.5e %12.5e %12.5e]\n" % (bb_max[0], bb_max[1], bb_max[2])
-        area_str = "        // Area = %.5e\n" % get_surface_area(i)
-        info_str = bb_min_str + bb_max_str + area_str
+            return 0, i.name, files
+
+        # Objects sharing a mesh are triangulated only once per export.
+        # Mesh is always evaluated again instead of using cached data,
+        # which may be outdated if the depsgraph handler missed a change.
+        if not rec.is_emesh:
+            key = get_mesh_data_key(i)
+            data = export_mesh_data.get(key)
+            if data is None:
+                data = evaluate_mesh_data(i, depsgraph)
+                export_mesh_data[key] = data
 
         # Add to dictionary string, except not edge mesh objects
         if not i.name.endswith("_eMesh"):
+            # Collect mesh min and max bounds and area to info string
+            bb_min, bb_max = get_object_bbox_coords(i)
+            bb_min_str = "        // Min Bounds = [%12.5e %12.5e %12.5e]\n" % (bb_min[0], bb_min[1], bb_min[2])
+            bb_max_str = "        // Max Bounds = [%12.5e %12.5e %12.5e]\n" % (bb_max[0], bb_max[1], bb_max[2])
+            area_str = "        // Area = %.5e\n" % get_instance_area(data, i.matrix_world)
+            info_str = bb_min_str + bb_max_str + area_str
             d += "    %s\n" % i.name \
                 + "    {\n        type triSurfaceMesh;\n" \
                 + "        file \"%s.stl\";\n" % i.name \
@@ -529,44 +909,246 @@ def export_geometries():
         # Note to self: Tried to add export_geometry_regions inside d,
         # but it seems that regions are not used for STLs, so left out.
 
-        export_path = gui.export_path
-        abspath = bpy.path.abspath(export_path)
-        i.select_set(True)
-
         # Export normal meshes to constant/triSurface/name.stl
         if not i.name.endswith("_eMesh"):
-            outpath = os.path.join(abspath, 'constant', 'triSurface', "%s.stl" % i.name)
-            if "export_mesh" in dir(bpy.ops):
-                # Blender 3.6 and earlier
-                bpy.ops.export_mesh.stl(
-                    filepath=outpath, check_existing=False, \
-                    axis_forward='Y', axis_up='Z', filter_glob="*.stl", \
-                    use_selection=True, global_scale=gui.export_scale, use_scene_unit=True, \
-                    ascii=gui.export_stl_ascii, use_mesh_modifiers=True)
-            elif "stl_export" in dir(bpy.ops.wm):
-                # Blender 4.2 and later
-                bpy.ops.wm.stl_export(
-                    filepath=outpath, check_existing=False, \
-                    forward_axis='Y', up_axis='Z', filter_glob="*.stl", \
-                    export_selected_objects=True, global_scale=gui.export_scale, use_scene_unit=True, \
-                    ascii_format=gui.export_stl_ascii, apply_modifiers=True)
+            filename = "%s.stl" % i.name
+            outpath = os.path.join(abspath, 'constant', 'triSurface', filename)
+            fingerprint = get_geometry_fingerprint(
+                data.digest, i.matrix_world, scale, gui.export_stl_ascii)
+            if old_manifest.get(filename) == fingerprint \
+               and os.path.isfile(outpath):
+                n_skipped += 1
             else:
-                raise Exception("No known STL exporters found")
-
-        # Edge meshes are exported to constant/triSurface/name.obj
+                verts = get_transformed_coords(data.verts, i.matrix_world, scale)
+                write_stl(outpath, verts, data.tris, i.name, gui.export_stl_ascii)
+
+            # Feature edges are written directly to
+            # constant/triSurface/name.eMesh, unless they are given
+            # by a corresponding _eMesh object
+            if gui.extract_features_in_blender \
+               and rec.shmg_include_feature_extraction \
+               and not rec.has_emesh_pair:
+                if not export_feature_edges(i, data, abspath, scale,
+                                            old_manifest, manifest, files):
+                    n_skipped += 1
+
+        # Edge meshes of objectname_eMesh are exported to
+        # constant/triSurface/objectname.eMesh
         else:
-            outpath = os.path.join(abspath, 'constant', 'triSurface', "%s.obj" % i.name)
-            bpy.ops.wm.obj_export(
-                filepath=outpath, check_existing=False, \
-                forward_axis='Y', up_axis='Z', global_scale=gui.export_scale, \
-                apply_modifiers=True, export_selected_objects=True, \
-                export_materials=False, export_uv=False, export_normals=False
-            )
-        i.select_set(False)
+            name = i.name[:-len("_eMesh")]
+            filename = "%s.eMesh" % name
+            outpath = os.path.join(abspath, 'constant', 'triSurface', filename)
+            verts, edges = get_mesh_edge_arrays(i, depsgraph)
+            fingerprint = get_geometry_fingerprint(
+                get_array_digest(verts, edges), i.matrix_world, scale,
+                not gui.export_emesh_binary)
+            if old_manifest.get(filename) == fingerprint \
+               and os.path.isfile(outpath):
+                n_skipped += 1
+            else:
+                verts = get_transformed_coords(verts, i.matrix_world, scale)
+                write_emesh(outpath, verts, edges, name, gui.export_emesh_binary)
+        manifest[filename] = fingerprint
+        files.append(outpath)
         n += 1
     d += "}"
 
-    return n, d
+    write_geometry_manifest(manifest_path, manifest)
+    l.debug("Skipped writing of %d unchanged geometry files" % n_skipped)
+
+    return n, d, files
+
+def export_feature_edges(obj, data, abspath, scale, old_manifest,
+                         manifest, files):
+    """Writes feature edges of MeshData data of object obj to
+    case/constant/triSurface/name.eMesh in case directory abspath,
+    unless the file is up to date according to geometry manifest
+    old_manifest. Adds the file to manifest and list of exported file
+    paths files. Returns True if the file was written.
+    """
+
+    from .op_object import get_instance_feature_edges, \
+        get_transformed_coords, FEATURE_INCLUDED_ANGLE
+    gui = bpy.context.scene.snappyhexmeshgui
+    filename = "%s.eMesh" % obj.name
+    outpath = os.path.join(abspath, 'constant', 'triSurface', filename)
+    fingerprint = get_geometry_fingerprint(
+        data.digest + " features %g" % FEATURE_INCLUDED_ANGLE,
+        obj.matrix_world, scale, not gui.export_emesh_binary)
+    manifest[filename] = fingerprint
+    files.append(outpath)
+    if old_manifest.get(filename) == fingerprint and os.path.isfile(outpath):
+        return False
+
+    verts, edges = get_used_edge_arrays(
+        data.verts, get_instance_feature_edges(obj, data))
+    verts = get_transformed_coords(verts, obj.matrix_world, scale)
+    write_emesh(outpath, verts, edges, obj.name, gui.export_emesh_binary)
+    return True
+
+def link_geometry_files(files, export_path):
+    """Links geometry files (list of paths) to case/constant/triSurface
+    folder. Hard links are used if possible, otherwise symbolic links,
+    and as a last resort files are copied.
+    """
+
+    from shutil import copy2
+    dirpath = os.path.join(bpy.path.abspath(export_path), 'constant', 'triSurface')
+    for src in files:
+        dst = os.path.join(dirpath, os.path.basename(src))
+        if os.path.lexists(dst):
+            if os.path.exists(dst) and os.path.samefile(src, dst):
+                continue
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            try:
+                os.symlink(os.path.relpath(src, dirpath), dst)
+            except OSError:
+                copy2(src, dst)
+    return None
+
+def unlink_geometry_file(filepath):
+    """Removes geometry file filepath if it exists. Geometry files may
+    be hard or symbolic links to shared files (see
+    link_geometry_files()), so they must be unlinked before writing
+    instead of overwriting the shared file contents.
+    """
+
+    if os.path.lexists(filepath):
+        os.remove(filepath)
+    return None
+
+# Name of the geometry manifest file in case/constant/triSurface
+GEOMETRY_MANIFEST_NAME = ".shmg_manifest.json"
+
+def get_geometry_fingerprint(digest, matrix, scale, ascii):
+    """Returns a fingerprint (hex digest string) of geometry defined
+    by mesh array digest (see get_array_digest()), object world matrix,
+    export scale and ASCII flag
+    """
+
+    import hashlib
+    h = hashlib.sha1()
+    h.update(digest.encode())
+    h.update(numpy.array(matrix, dtype=numpy.float64).tobytes())
+    h.update(("%r %r" % (scale, bool(ascii))).encode())
+    return h.hexdigest()
+
+def read_geometry_manifest(filepath):
+    """Returns geometry manifest dictionary (file name to fingerprint)
+    read from filepath, or an empty dictionary if it can't be read
+    """
+
+    import json
+    try:
+        with open(filepath, 'r') as infile:
+            manifest = json.load(infile)
+    except (OSError, ValueError):
+        return dict()
+    if not isinstance(manifest, dict):
+        return dict()
+    return manifest
+
+def write_geometry_manifest(filepath, manifest):
+    """Writes geometry manifest dictionary to filepath"""
+
+    import json
+    with open(filepath, 'w') as outfile:
+        json.dump(manifest, outfile, indent=1, sort_keys=True)
+    return None
+
+# Binary STL triangle record: normal, three vertices and attribute
+# byte count, 50 bytes in total
+STL_RECORD_DTYPE = numpy.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attribute', '<u2'),
+])
+
+def write_stl(filepath, verts, tris, name, ascii=False):
+    """Writes triangles to STL file filepath. verts is a numpy array of
+    vertex coordinates and tris a numpy array of triangle vertex
+    indices, name is the solid name. File is written in binary format
+    unless ascii is True.
+    """
+
+    unlink_geometry_file(filepath)
+    tri_coords = verts[tris]
+    normals = numpy.cross(tri_coords[:, 1] - tri_coords[:, 0],
+                          tri_coords[:, 2] - tri_coords[:, 0])
+    lengths = numpy.linalg.norm(normals, axis=1)
+    lengths[lengths == 0.0] = 1.0
+    normals /= lengths[:, numpy.newaxis]
+
+    if ascii:
+        facet = " facet normal %e %e %e\n  outer loop\n" \
+            + "   vertex %e %e %e\n" * 3 + "  endloop\n endfacet\n"
+        data = numpy.hstack((normals, tri_coords.reshape(-1, 9)))
+        with open(filepath, 'w') as outfile:
+            outfile.write("solid %s\n" % name)
+            outfile.write(''.join(facet % tuple(row) for row in data.tolist()))
+            outfile.write("endsolid %s\n" % name)
+        return None
+
+    records = numpy.zeros(len(tris), dtype=STL_RECORD_DTYPE)
+    records['normal'] = normals
+    records['vertices'] = tri_coords
+    header = ("Binary STL %s exported by SnappyHexMesh GUI" % name).encode()
+    with open(filepath, 'wb') as outfile:
+        outfile.write(header[:80].ljust(80, b' '))
+        outfile.write(numpy.uint32(len(tris)).astype('<u4').tobytes())
+        records.tofile(outfile)
+    return None
+
+def get_used_edge_arrays(verts, edges):
+    """Returns vertex coordinates and edge vertex indices of edges
+    (numpy array of shape (M, 2) of indices to vertex coordinate array
+    verts), with vertices not used by any edge removed
+    """
+
+    used, inverse = numpy.unique(edges, return_inverse=True)
+    return verts[used], inverse.reshape(-1, 2).astype(numpy.int32)
+
+def write_emesh(filepath, verts, edges, name, binary=False):
+    """Writes edges to OpenFOAM edge mesh file filepath. verts is a
+    numpy array of vertex coordinates and edges a numpy array of edge
+    vertex indices, name is the object name. File is written in ASCII
+    format unless binary is True.
+    """
+
+    header = "FoamFile\n{\n    version     2.0;\n" \
+        + "    format      %s;\n" % ("binary" if binary else "ascii") \
+        + "    class       featureEdgeMesh;\n" \
+        + "    location    \"constant/triSurface\";\n" \
+        + "    object      %s.eMesh;\n}\n\n" % name
+    unlink_geometry_file(filepath)
+    if binary:
+        # Binary lists contain raw little endian 64 bit scalars and 32
+        # bit labels, which is the default OpenFOAM build
+        header = header.replace(
+            "    location", "    arch        \"LSB;label=32;scalar=64\";\n"
+            + "    location")
+        with open(filepath, 'wb') as outfile:
+            outfile.write((header + get_header_text() + "\n\n").encode())
+            outfile.write(("// points:\n\n%d\n(" % len(verts)).encode())
+            outfile.write(numpy.ascontiguousarray(verts, dtype='<f8').tobytes())
+            outfile.write((")\n\n// edges:\n\n%d\n(" % len(edges)).encode())
+            outfile.write(numpy.ascontiguousarray(edges, dtype='<i4').tobytes())
+            outfile.write(b")\n")
+        return None
+
+    with open(filepath, 'w') as outfile:
+        outfile.write(header + get_header_text() + "\n\n")
+        outfile.write("// points:\n\n%d\n(\n" % len(verts))
+        outfile.write(''.join("(%.9g %.9g %.9g)\n" % tuple(row) \
+                              for row in verts.tolist()))
+        outfile.write(")\n\n// edges:\n\n%d\n(\n" % len(edges))
+        outfile.write(''.join("(%d %d)\n" % tuple(row) \
+                              for row in edges.tolist()))
+        outfile.write(")\n")
+    return None
 
 def export_geometry_regions(obj):
     """Creates regions for geometry entries in snappyHexMeshDict
@@ -580,20 +1162,16 @@ def export_geometry_regions(obj):
     return d
 
 
-def export_refinement_surfaces():
+def export_refinement_surfaces(snapshot):
     """Creates refinement surface entries for snappyHexMeshDict"""
 
     # Collect dictionary string to d
     d = ""
 
-    for i in bpy.data.objects:
-        if i.type != 'MESH':
-            continue
-        if not i.shmg_include_in_export:
-            continue
+    for i in snapshot.objects:
         if not i.shmg_include_snapping:
             continue
-        if i.name.endswith("_eMesh"):
+        if i.is_emesh:
             continue
 
         d += "        %s\n" % i.name \
@@ -607,20 +1185,16 @@ def export_refinement_surfaces():
              + "        }\n"
     return d
 
-def export_refinement_volumes():
+def export_refinement_volumes(snapshot):
     """Creates refinement regions (volumes) entries for snappyHexMeshDict"""
 
     # Collect dictionary string to d
     d = ""
 
-    for i in bpy.data.objects:
-        if i.type != 'MESH':
-            continue
-        if not i.shmg_include_in_export:
-            continue
+    for i in snapshot.objects:
         if i.shmg_volume_type == 'none':
             continue
-        if i.name.endswith("_eMesh"):
+        if i.is_emesh:
             continue
 
         d += "        %s\n" % i.name + "        {\n" \
@@ -657,20 +1231,16 @@ def get_cell_zone_definitions(obj):
     return d
 
 
-def export_surface_features():
+def export_surface_features(snapshot):
     """Creates surface features entries for snappyHexMeshDict"""
 
     # Collect dictionary string to d
     d = ""
 
-    for i in bpy.data.objects:
-        if i.type != 'MESH':
-            continue
-        if not i.shmg_include_in_export:
-            continue
+    for i in snapshot.objects:
         if not i.shmg_include_feature_extraction:
             continue
-        if i.name.endswith("_eMesh"):
+        if i.is_emesh:
             continue
         d += "        {\n            file \"" \
              + str(i.name) + ".eMesh\";\n" \
@@ -678,20 +1248,16 @@ def export_surface_features():
              + "        }\n"
     return d
 
-def export_surface_layers(dict_number):
+def export_surface_layers(snapshot, dict_number):
     """Creates surface layer entries for snappyHexMeshDict file number dict_number"""
 
     # Collect dictionary string to d
     d = ""
 
-    for i in bpy.data.objects:
-        if i.type != 'MESH':
-            continue
-        if not i.shmg_include_in_export:
-            continue
+    for i in snapshot.objects:
         if i.shmg_dict_number != dict_number:
             continue
-        if i.name.endswith("_eMesh"):
+        if i.is_emesh:
             continue
 
         if i.shmg_surface_layers > 0:
@@ -716,16 +1282,14 @@ def export_surface_layers(dict_number):
 
     return d
 
-def copy_skeleton_files():
-    """Copies OpenFOAM skeleton files to case directory
+def copy_skeleton_files(abspath):
+    """Copies OpenFOAM skeleton files to case directory abspath
     unless they already exist there
     """
 
     from shutil import copyfile
-    export_path = bpy.context.scene.snappyhexmeshgui.export_path
-    abspath = bpy.path.abspath(export_path)
 
-    for i in ["controlDict", "fvSchemes", "fvSolution"]:
+    for i in ["fvSchemes", "fvSolution"]:
         filepath = os.path.join(abspath, 'system', i)
         if not (os.path.isfile(filepath)):
             sourcepath = os.path.join(os.path.dirname(__file__), 'skel', i)
@@ -737,74 +1301,335 @@ def copy_skeleton_files():
     Path(os.path.join(abspath, "case.foam")).touch()
     return None
 
-def create_run(abspath):
-    """Creates a bash run script in the case directory
+# Name of the file in case directory where the run script appends
+# JSON lines of step metrics (time and memory usage)
+RUN_METRICS_NAME = "run_metrics.jsonl"
+
+# Name of the directory for stamp files of completed run steps, used
+# by the generated Makefile
+RUN_STAMP_DIR = ".run_stamps"
+
+class RunStep:
+    """Step of the mesh generation run. name is used for the log file
+    and stamp file names, command is the command line to run, inputs
+    contains case file paths read by the step and deps contains the
+    names of steps which must be completed before this step. Disabled
+    steps are written as comments to the run script only. clean
+    contains case paths of mesh results of previous runs, which are
+    removed before running the step.
     """
 
-    import os
-    import stat
+    __slots__ = ('name', 'command', 'inputs', 'deps', 'enabled', 'clean')
+
+    def __init__(self, name, command, inputs=(), deps=(), enabled=True,
+                 clean=()):
+        self.name = name
+        self.command = command
+        self.inputs = list(inputs)
+        self.deps = list(deps)
+        self.enabled = enabled
+        self.clean = list(clean)
+
+def get_run_steps(snapshot):
+    """Returns list of RunSteps for mesh generation, in the order of
+    sequential execution
+    """
+
+    from .op_object import get_number_of_cpus
     gui = bpy.context.scene.snappyhexmeshgui
+    n_cpus = get_number_of_cpus(bpy.context.scene)
 
     if gui.openfoam_framework == 'openfoam.org':
         extract_command = "surfaceFeatures"
+        extract_dict = "system/surfaceFeaturesDict"
     else:
         extract_command = "surfaceFeatureExtract"
+        extract_dict = "system/surfaceFeatureExtractDict"
+
+    stl_files = ["constant/triSurface/%s.stl" % i.name \
+                 for i in snapshot.objects if not i.is_emesh]
+    feature_names = [i.name for i in snapshot.objects \
+                     if i.shmg_include_feature_extraction \
+                     and not i.is_emesh and not i.has_emesh_pair]
+
+    block_mesh = RunStep("blockMesh", "blockMesh", ["system/blockMeshDict"])
+    steps = [block_mesh]
+    # Feature edges extracted in Blender are already written to
+    # eMesh files on export
+    if gui.extract_features_in_blender:
+        emesh_files = ["constant/triSurface/%s.eMesh" % name \
+                       for name in feature_names]
+    else:
+        emesh_files = []
+        steps.append(RunStep(
+            extract_command, extract_command, [extract_dict] \
+            + ["constant/triSurface/%s.stl" % name for name in feature_names]))
+
+    # Edge meshes of _eMesh objects are written to eMesh files on export
+    emesh_files += ["constant/triSurface/%s.eMesh" % i.name[:-len("_eMesh")] \
+                    for i in snapshot.objects if i.is_emesh]
+
+    snappy_inputs = ["system/snappyHexMeshDict",
+                     "system/meshQualityDict"] + stl_files + emesh_files
+    surface_deps = [step.name for step in steps]
+
+    # With -overwrite only the final mesh is written to constant/polyMesh
+    # instead of a time directory for each meshing phase. Mesh which is
+    # kept decomposed for a parallel solver run is always written to
+    # processor*/constant.
+    overwrite = gui.overwrite_mesh or (gui.keep_decomposed and n_cpus > 1)
+    options = " -overwrite" if overwrite else ""
+    time_option = "" if overwrite else " -latestTime"
+
+    if n_cpus == 1:
+        steps.append(RunStep("snappyHexMesh", "snappyHexMesh" + options,
+                             snappy_inputs, surface_deps))
+        steps += get_layer_pass_steps(snapshot, "", options)
+        steps += [
+            RunStep("checkMesh", "checkMesh" + time_option, [],
+                    [steps[-1].name]),
+            RunStep("postProcess", "postProcess -time '1:'", [],
+                    ["checkMesh"], enabled=False),
+        ]
+    else:
+        mpirun = "mpirun -np %d " % n_cpus
+        # Collated file handler writes processor data to a single
+        # processors<N> directory instead of a directory per process
+        handler = " -fileHandler collated" if gui.collated_file_handler else ""
+        steps += [
+            RunStep("decomposePar", "decomposePar -force" + handler,
+                    ["system/decomposeParDict"], ["blockMesh"]),
+            RunStep("snappyHexMesh",
+                    mpirun + "snappyHexMesh -parallel" + options + handler,
+                    snappy_inputs, surface_deps + ["decomposePar"]),
+        ]
+        # Additional layer passes run on the decomposed mesh, which is
+        # reconstructed only once at the end
+        steps += get_layer_pass_steps(snapshot, mpirun, options + handler)
+        if gui.keep_decomposed:
+            if gui.renumber_mesh:
+                steps.append(RunStep(
+                    "renumberMesh", mpirun + "renumberMesh -parallel -overwrite" + handler,
+                    [], [steps[-1].name]))
+            steps += [
+                RunStep("checkMesh", mpirun + "checkMesh -parallel" + handler,
+                        [], [steps[-1].name]),
+            ]
+        else:
+            # Reconstruct the mesh from the time directory or from
+            # constant, where overwritten mesh is
+            reconstruct_option = " -constant" if overwrite else " -latestTime"
+            steps += [
+                RunStep("checkMesh",
+                        mpirun + "checkMesh" + time_option + " -parallel" + handler,
+                        [], [steps[-1].name]),
+                RunStep("postProcess",
+                        mpirun + "postProcess -time '1:' -parallel" + handler,
+                        [], ["checkMesh"], enabled=False),
+                RunStep("reconstructParMesh",
+                        "reconstructParMesh" + reconstruct_option + handler,
+                        [], ["checkMesh"]),
+                RunStep("reconstructPar",
+                        "reconstructPar" + reconstruct_option + handler,
+                        [], ["reconstructParMesh"]),
+                RunStep("checkMesh", "checkMesh" + time_option, [],
+                        ["reconstructPar"], enabled=False),
+            ]
+
+    # Mesh steps modify the mesh in place, so none of them can be rerun
+    # alone. Inputs of all mesh steps are moved to blockMesh, which
+    # starts the whole mesh chain again from a clean case. Feature
+    # extraction is independent and has the same inputs as blockMesh.
+    for step in steps[1:]:
+        block_mesh.inputs += [p for p in step.inputs \
+                              if p not in block_mesh.inputs]
+        if step.name != extract_command:
+            step.inputs = []
+
+    # Only the mesh outputs of these steps are cleaned, so that e.g.
+    # solver results in other time directories are kept. Without
+    # -overwrite snappyHexMesh writes a time directory for each meshing
+    # phase and layer pass. Processor directories are replaced by
+    # decomposePar -force.
+    n_times = 0
+    if not overwrite:
+        n_times = int(gui.do_castellation) + int(gui.do_snapping) \
+            + int(gui.do_add_layers) \
+            + len([step for step in steps \
+                   if step.name.startswith("snappyHexMesh_")])
+    block_mesh.clean = ["constant/polyMesh"] \
+        + [str(i) for i in range(1, n_times + 1)]
+    return steps
+
+def get_layer_pass_steps(snapshot, mpirun, options=""):
+    """Returns list of RunSteps for additional layer addition passes
+    with snappyHexMeshDictN files (dict numbers larger than one), each
+    starting from the mesh of the previous pass. mpirun is the prefix
+    for parallel commands, or an empty string for serial run. options
+    are appended to snappyHexMesh commands.
+    """
+
+    gui = bpy.context.scene.snappyhexmeshgui
+    if not gui.do_add_layers:
+        return []
+
+    steps = []
+    previous = "snappyHexMesh"
+    for i in sorted(n for n in get_dict_numbers(snapshot) if n > 1):
+        name = "snappyHexMesh_%d" % i
+        dict_path = "system/snappyHexMeshDict%d" % i
+        command = mpirun + "snappyHexMesh -dict " + dict_path
+        if mpirun:
+            command += " -parallel"
+        command += options
+        steps.append(RunStep(name, command, [dict_path], [previous]))
+        previous = name
+    return steps
+
+def create_run(abspath, snapshot):
+    """Creates a bash run script in the case directory, and optionally
+    a Makefile which runs the steps in dependency order
+    """
+
+    import os
+    import stat
+    gui = bpy.context.scene.snappyhexmeshgui
+    steps = get_run_steps(snapshot)
+    clean_paths = [p for step in steps if step.enabled for p in step.clean]
 
     run = """#!/bin/bash
 # OpenFOAM Run script generated by SnappyHexMesh GUI
+# Usage: ./run runs all steps sequentially,
+#        ./run step NAME COMMAND... runs a single step (used by Makefile)
+#        ./run clean removes mesh results of previous runs
+
+function clean_mesh(){
+  # Remove mesh written by previous runs, so that meshing starts
+  # from a fresh block mesh
+  rm -rf """ + " ".join(clean_paths) + """
+}
 
 function run_and_log(){
   # Run a command and redirect it's output to a log file.
   # First argument is the program name (log file name),
   # rest of the arguments contain the string to run the program.
+  # Elapsed time, user and system CPU time and maximum resident set
+  # size of the command are appended as a JSON line to metrics file.
 
   cmd=$1
   run_commands="${@:2}"
   echo "Running $cmd with command: $run_commands"
-  $run_commands &> log."$cmd"
-  if [ $? -ne 0 ]; then
+  timefile=log."$cmd".time
+  max_rss=null
+  if [ "$gnu_time" == "1" ]; then
+    /usr/bin/time -o "$timefile" -f "%e %U %S %M" $run_commands &> log."$cmd"
+    status=$?
+    read elapsed user sys max_rss < <(tail -n 1 "$timefile")
+  else
+    TIMEFORMAT="%R %U %S"
+    { time $run_commands &> log."$cmd" ; } 2> "$timefile"
+    status=$?
+    read elapsed user sys < "$timefile"
+  fi
+  rm -f "$timefile"
+  escaped_commands=${run_commands//\\\\/\\\\\\\\}
+  escaped_commands=${escaped_commands//\\"/\\\\\\"}
+  echo "{\\"step\\": \\"$cmd\\", \\"command\\": \\"$escaped_commands\\"," \\
+       "\\"status\\": $status, \\"elapsed\\": ${elapsed:-null}," \\
+       "\\"user\\": ${user:-null}, \\"sys\\": ${sys:-null}," \\
+       "\\"max_rss_kb\\": ${max_rss:-null}, \\"end_time\\": $(date +%s)}" \\
+       >> """ + RUN_METRICS_NAME + """
+  if [ $status -ne 0 ]; then
     echo "Running $cmd failed, see log."$cmd". Exiting."
     exit 1
   fi
 }
 
-"""
-    run += "run_and_log blockMesh blockMesh\n"
-    run += "run_and_log %s %s\n" % (extract_command, extract_command)
+# Maximum memory usage is measured with GNU time if available (BSD and
+# macOS /usr/bin/time don't support -f), otherwise bash time is used
+if /usr/bin/time -f "%e" true &> /dev/null; then
+  gnu_time=1
+else
+  gnu_time=0
+fi
 
-    # Add surfaceFeatureConvert commands for all _eMesh objects
-    i = 0
-    for ob in bpy.data.objects:
-        if not (ob.name + "_eMesh") in bpy.data.objects:
-            continue
-        i += 1
-        run += "run_and_log surfaceFeatureConvert_" + str(i) + \
-            " surfaceFeatureConvert constant/triSurface/" + ob.name + "_eMesh.obj" + \
-            " constant/triSurface/" + ob.name + ".eMesh\n"
-
-    if gui.number_of_cpus == 1:
-        run += "run_and_log snappyHexMesh snappyHexMesh\n"
-        run += "run_and_log checkMesh checkMesh -latestTime\n"
-        run += "# run_and_log postProcess postProcess -time '1:'\n"
-    else:
-        run += "run_and_log decomposePar decomposePar\n" + \
-            "run_and_log snappyHexMesh mpirun -np %s snappyHexMesh -parallel\n" % gui.number_of_cpus + \
-            "run_and_log checkMesh mpirun -np %s checkMesh -latestTime -parallel\n" % gui.number_of_cpus + \
-            "# run_and_log postProcess mpirun -np %s postProcess -time '1:' -parallel\n" % gui.number_of_cpus + \
-            "run_and_log reconstructParMesh reconstructParMesh -latestTime\n" + \
-            "run_and_log reconstructPar reconstructPar -latestTime\n" + \
-            "# run_and_log checkMesh checkMesh -latestTime\n"
+if [ "$1" == "step" ]; then
+  run_and_log "${@:2}"
+  exit 0
+fi
+
+if [ "$1" == "clean" ]; then
+  clean_mesh
+  exit 0
+fi
+
+"""
+    for step in steps:
+        if step.clean and step.enabled:
+            run += "clean_mesh\n"
+        if not step.enabled:
+            run += "# "
+        run += "run_and_log %s %s\n" % (step.name, step.command)
 
     run += "echo \"Run done!\"\n"
 
     filename = os.path.join(abspath, "run")
-    outfile = open(filename, 'w')
-    outfile.write(''.join(run))
-    outfile.close()
+    write_case_file(filename, run)
     # Make sure the file has executable attribute
     st = os.stat(filename)
     os.chmod(filename, st.st_mode | stat.S_IEXEC)
 
+    if gui.export_makefile:
+        write_case_file(os.path.join(abspath, "Makefile"),
+                        get_makefile_text(steps))
+
+def get_makefile_text(steps):
+    """Returns Makefile contents for running enabled RunSteps steps.
+    Each step touches a stamp file when completed, and it is rerun only
+    if its input files or the stamps of its dependencies are newer.
+    Steps which depend on a cleaning step (blockMesh) modify its
+    results, so if one of them fails, the stamp of the cleaning step is
+    removed to restart the chain from a clean case on the next run.
+    """
+
+    def escape(path):
+        return path.replace("$", "$$").replace(" ", "\\ ")
+
+    enabled = [step for step in steps if step.enabled]
+    stamp = lambda name: "$(STAMPS)/" + escape(name)
+
+    d = "# OpenFOAM Makefile generated by SnappyHexMesh GUI\n" \
+        + "# Run 'make -j N' to run independent steps concurrently.\n" \
+        + "# Steps are rerun only when their input files have changed.\n" \
+        + "# Any change in mesh step inputs reruns meshing from blockMesh.\n\n" \
+        + "STAMPS = %s\n\n" % RUN_STAMP_DIR \
+        + ".PHONY: all\n" \
+        + "all: %s\n\n" % " ".join(stamp(s.name) for s in enabled) \
+        + "$(STAMPS):\n\tmkdir -p $(STAMPS)\n"
+
+    names = set(step.name for step in enabled)
+    # Stamp of the cleaning step which starts the chain of each step
+    chain_start = dict()
+    for step in enabled:
+        if step.clean:
+            chain_start[step.name] = step.name
+        for name in step.deps:
+            if name in chain_start:
+                chain_start[step.name] = chain_start[name]
+
+    for step in enabled:
+        prereqs = [escape(p) for p in step.inputs] \
+            + [stamp(name) for name in step.deps if name in names]
+        command = "./run step %s %s" % (step.name, step.command.replace("$", "$$"))
+        if step.name in chain_start and not step.clean:
+            command += " || { rm -f %s; exit 1; }" % stamp(chain_start[step.name])
+        d += "\n%s: %s | $(STAMPS)\n" % (stamp(step.name), " ".join(prereqs))
+        if step.clean:
+            d += "\t./run clean\n"
+        d += "\t%s\n" % command \
+            + "\ttouch $@\n"
+    return d
+
 class OBJECT_OT_snappyhexmeshgui_apply_locrotscale(bpy.types.Operator):
 
     """Apply LocRotScale (SnappyHexMeshGUI)"""
@@ -909,7 +1734,7 @@ def cleanup_meshes():
 
 
 class OBJECT_OT_snappyhexmeshgui_clean_case_dir(bpy.types.Operator):
-    """Clean Case Directory (Remove folders 1-9 constant system processor*) (SnappyHexMeshGUI)"""
+    """Clean Case Directory (Remove folders 1-9 constant system processor*). Files are Deleted in Background (SnappyHexMeshGUI)"""
     bl_idname = "object.snappyhexmeshgui_clean_case_dir"
     bl_label = "SnappyHexMeshGUI Clean Case Directory"
 
@@ -923,45 +1748,142 @@ class OBJECT_OT_snappyhexmeshgui_clean_case_dir(bpy.types.Operator):
         self.report({'INFO'}, "Deleted: " + deleted_names)
         return {'FINISHED'}
 
+def is_processor_dir(name):
+    """Returns True if name is a processor directory name of either
+    uncollated (processorN) or collated (processorsN or processorsN_A-B)
+    parallel data layout
+    """
+
+    return re.match(r"^processor(\d+|s\d+(_\d+-\d+)?)$", name) is not None
+
+
+# Name of the directory in case directory where clean_case_dir() moves
+# the removed files and directories for deletion in background
+TRASH_DIR_NAME = ".shmg_trash"
+
+# Thread pool for deleting trash in background, created on first use
+trash_executor = None
+
+# Paths in trash which are currently being deleted
+pending_trash = set()
+
+
 def clean_case_dir():
     """Removes OpenFOAM directories (if they exist) from blend file save
     location to clean up case folder and make it ready for new export.
+    Only the top level of the case directory is scanned. Removed items
+    are renamed into a trash directory, and deleted in background
+    threads, so this returns immediately.
     """
 
-    from shutil import rmtree
-    names = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "system", "constant"]
+    import tempfile
+    names = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "system", "constant",
+             RUN_STAMP_DIR, RUN_METRICS_NAME, "run", "Makefile"]
     export_path = bpy.context.scene.snappyhexmeshgui.export_path
     abspath = bpy.path.abspath(export_path)
     l.debug ("Absolute path is %r" % abspath)
-    deleted_names = ''
+    if not os.path.isdir(abspath):
+        return "None"
 
-    from os import walk
-    for dirpath, directorynames, filenames in walk(abspath):
-        # Add processor directories for deletion, if any
-        for dirname in directorynames:
-            if dirname.startswith("processor"):
-                names.append(dirname)
-        # Delete old log files
-        for filename in filenames:
-            if filename.startswith("log."):
-                names.append(filename)
-            if filename == "run":
-                names.append(filename)
-
-    for i in names:
-        filepath = os.path.join(abspath, i)
-        if os.path.isdir(filepath):
-            rmtree(filepath)
-            deleted_names += i + " "
-        elif os.path.isfile(filepath):
-            os.remove(filepath)
-            deleted_names += i + " "
-
-    if not deleted_names:
+    targets = []
+    with os.scandir(abspath) as entries:
+        for entry in entries:
+            if entry.name in names or entry.name.startswith("log.") \
+               or (is_processor_dir(entry.name) and entry.is_dir()):
+                targets.append(entry.name)
+    if not targets:
+        purge_trash(abspath)
         return "None"
+
+    trash_root = os.path.join(abspath, TRASH_DIR_NAME)
+    os.makedirs(trash_root, exist_ok=True)
+    batch_path = tempfile.mkdtemp(prefix="clean_", dir=trash_root)
+
+    from shutil import rmtree
+    deleted_names = ''
+    for name in sorted(targets):
+        filepath = os.path.join(abspath, name)
+        try:
+            # Rename is atomic and fast on the same file system
+            os.rename(filepath, os.path.join(batch_path, name))
+        except OSError:
+            if os.path.isdir(filepath):
+                rmtree(filepath, ignore_errors=True)
+            else:
+                try:
+                    os.remove(filepath)
+                except OSError as e:
+                    l.debug("Failed to delete %r: %s" % (filepath, e))
+                    continue
+        deleted_names += name + " "
+
+    purge_trash(abspath)
     return deleted_names
 
 
+def purge_trash(abspath):
+    """Deletes contents of trash directory of case directory abspath
+    with a pool of background threads. Also leftovers from earlier
+    interrupted deletions are deleted. Trash directories which have
+    become empty are removed here, never by the background threads, so
+    the trash directory can't disappear while it is in use.
+    """
+
+    global trash_executor
+    from concurrent.futures import ThreadPoolExecutor
+
+    trash_root = os.path.join(abspath, TRASH_DIR_NAME)
+    if not os.path.isdir(trash_root):
+        return
+    if trash_executor is None:
+        trash_executor = ThreadPoolExecutor(
+            max_workers=min(8, os.cpu_count() or 1))
+
+    with os.scandir(trash_root) as batches:
+        batch_paths = [batch.path for batch in batches if batch.is_dir()]
+    for batch_path in batch_paths:
+        # Each item is deleted by a separate job, so that e.g.
+        # processor directories are deleted in parallel
+        with os.scandir(batch_path) as entries:
+            items = [entry.path for entry in entries]
+        if not items:
+            remove_empty_dir(batch_path)
+            continue
+        for path in items:
+            if path in pending_trash:
+                continue
+            pending_trash.add(path)
+            trash_executor.submit(delete_trash_item, path)
+    remove_empty_dir(trash_root)
+
+
+def delete_trash_item(path):
+    """Deletes file or directory path from trash (run in a background
+    thread)
+    """
+
+    from shutil import rmtree
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    except OSError as e:
+        l.debug("Failed to delete %r: %s" % (path, e))
+    finally:
+        pending_trash.discard(path)
+
+
+def remove_empty_dir(path):
+    """Removes directory path if it is empty. Returns True if removed."""
+
+    try:
+        os.rmdir(path)
+    except OSError:
+        return False
+    return True
+
+
 class OBJECT_OT_snappyhexmeshgui_add_location_in_mesh_object(bpy.types.Operator):
     """Add Location in Mesh Object (SnappyHexMeshGUI)"""
     bl_idname = "object.snappyhexmeshgui_add_location_in_mesh_object"
@@ -978,7 +1900,7 @@ class OBJECT_OT_snappyhexmeshgui_add_location_in_mesh_object(bpy.types.Operator)
         self.report({'INFO'}, "Added %r" % bpy.context.active_object.name)
         return {'FINISHED'}
 
-def get_location_in_mesh():
+def get_location_in_mesh(snapshot):
     """Creates dictionary string for a user specified location in mesh.
     Coordinates of object "Location In Mesh" is used, or if it does not
     exist, zero coordinates.
@@ -986,25 +1908,20 @@ def get_location_in_mesh():
 
     scale = bpy.context.scene.snappyhexmeshgui.export_scale
 
-    # Find locations in mesh objects
-    locs = []
-    for i in bpy.data.objects:
-        if i.type != "EMPTY":
-            continue
-        if i.name.startswith("Location In Mesh"):
-            locs.append(i)
+    # Locations in mesh objects
+    locs = snapshot.locations
 
     # Export based on the number of objects
     if len(locs) == 0:
         return "locationInMesh (0 0 0);"
 
     elif len(locs) == 1:
-        i = locs[0]
-        return "locationInMesh (" + str(scale * i.location.x) + " " + str(scale * i.location.y) + " " + str(scale * i.location.z) + ");"
+        name, loc = locs[0]
+        return "locationInMesh (" + str(scale * loc.x) + " " + str(scale * loc.y) + " " + str(scale * loc.z) + ");"
     else:
         d = "locationsInMesh\n    (\n"
-        for i in locs:
-            d += "        ((" + str(scale * i.location.x) + " " + str(scale * i.location.y) + " " + str(scale * i.location.z) + ") " + i.name.split("Location In Mesh")[1] + ")\n"
+        for name, loc in locs:
+            d += "        ((" + str(scale * loc.x) + " " + str(scale * loc.y) + " " + str(scale * loc.z) + ") " + name.split("Location In Mesh")[1] + ")\n"
         d += "    );"
         return d
 
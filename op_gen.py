@@ -27,11 +27,11 @@
 import importlib
 import bpy
 import os
-#import re
+import re
 import bmesh
 import mathutils
 #import array
-#import numpy
+import numpy
 import math
 from sys import float_info
 
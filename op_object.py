@@ -67,44 +67,667 @@ def get_global_bbox_coords():
     return global_min_bbox, global_max_bbox
 
 
-def block_mesh_cell_count(bb_min, bb_max, gui):
-    """Returns number of cells in Block Mesh and updates
-    block_mesh_* data in gui. bb_min and bb_max are
-    minimum and maximum bounding box coordinates.
+# Cache of global bounding box coordinates. Key is scene name, value
+# is a tuple of minimum and maximum coordinates. Cache is cleared by
+# depsgraph_update_post_handler() when transformation or geometry of
+# an included object changes.
+global_bbox_cache = dict()
+
+def get_cached_global_bbox_coords(scene):
+    """Returns cached global bounding box coordinates for scene,
+    see get_global_bbox_coords()
     """
 
-    sl = gui.cell_side_length
+    cached = global_bbox_cache.get(scene.name)
+    if cached is None:
+        cached = get_global_bbox_coords()
+        global_bbox_cache[scene.name] = cached
+    return cached
+
+
+def include_in_export_update(self, context):
+    """Update function for object property shmg_include_in_export"""
+
+    global_bbox_cache.clear()
+    cell_count_estimate_cache.clear()
+
+
+def get_block_mesh_dimensions(bb_min, bb_max, sl):
+    """Returns block mesh division counts, minimum and maximum
+    coordinates for cell side length sl. bb_min and bb_max are
+    minimum and maximum bounding box coordinates.
+    """
 
+    bm_delta = [0, 0, 0]
+    bm_mins = [0.0, 0.0, 0.0]
+    bm_maxs = [0.0, 0.0, 0.0]
     for i in range(0, 3):
         bb_min_with_margin = bb_min[i] - sl/2.0
         bb_max_with_margin = bb_max[i] + sl/2.0
         bm_min = math.floor(bb_min_with_margin / sl)
         bm_max = math.ceil(bb_max_with_margin / sl)
-        gui.block_mesh_delta[i] = bm_max - bm_min
-        gui.block_mesh_min[i] = bm_min * sl
-        gui.block_mesh_max[i] = bm_max * sl
+        bm_delta[i] = bm_max - bm_min
+        bm_mins[i] = bm_min * sl
+        bm_maxs[i] = bm_max * sl
 
-    bm_count = gui.block_mesh_delta[0] * \
-               gui.block_mesh_delta[1] * \
-               gui.block_mesh_delta[2]
+    return bm_delta, bm_mins, bm_maxs
+
+
+def get_block_mesh_cell_count(bb_min, bb_max, sl):
+    """Returns number of cells in Block Mesh for cell side length sl
+    without modifying any data
+    """
+
+    bm_delta = get_block_mesh_dimensions(bb_min, bb_max, sl)[0]
+    return bm_delta[0] * bm_delta[1] * bm_delta[2]
+
+
+def block_mesh_cell_count(bb_min, bb_max, gui):
+    """Returns number of cells in Block Mesh and updates
+    block_mesh_* data in gui. bb_min and bb_max are
+    minimum and maximum bounding box coordinates.
+    """
 
-    return bm_count
+    bm_delta, bm_mins, bm_maxs = \
+        get_block_mesh_dimensions(bb_min, bb_max, gui.cell_side_length)
+    gui.block_mesh_delta = bm_delta
+    gui.block_mesh_min = bm_mins
+    gui.block_mesh_max = bm_maxs
+
+    return bm_delta[0] * bm_delta[1] * bm_delta[2]
+
+# Cache of surface areas of mesh objects. Key is object name, value is
+# a tuple of (mesh name, world matrix, area). Entries are removed upon
+# geometry updates by depsgraph_update_post_handler().
+surface_area_cache = dict()
 
 def get_surface_area(obj):
-    """Returns surface area of mesh object obj"""
+    """Returns surface area of mesh object obj. Area is cached until
+    the mesh data or world matrix of the object changes.
+    """
 
     if obj.type != 'MESH':
         return 0.0
 
-    bm = bmesh.new()
-    bm.from_mesh(obj.data)
-    bm.transform(obj.matrix_world) # Apply transformation
-    bmesh.ops.triangulate(bm, faces=bm.faces) # Triangulate
-    area = sum(f.calc_area() for f in bm.faces)
-    del bm
+    matrix = tuple(tuple(row) for row in obj.matrix_world)
+    cached = surface_area_cache.get(obj.name)
+    if cached and cached[0] == obj.data.name and cached[1] == matrix:
+        return cached[2]
+
+    area = get_instance_area(get_mesh_data(obj), obj.matrix_world)
+    surface_area_cache[obj.name] = (obj.data.name, matrix, area)
     return area
 
 
+class MeshData:
+    """Triangulated evaluated mesh data in object local coordinates.
+    Contains vertex coordinates verts, triangle vertex indices tris,
+    total triangle area, signed enclosed volume and digest (hex string)
+    of the mesh arrays. Feature edges are extracted on first access
+    of get_feature_edges().
+    """
+
+    __slots__ = ('verts', 'tris', 'area', 'volume', 'digest',
+                 'feature_edges', 'feature_edge_length')
+
+    def __init__(self, verts, tris):
+        self.verts = verts
+        self.tris = tris
+        self.area = float(get_triangle_areas(verts, tris).sum())
+        self.volume = get_enclosed_volume(verts, tris)
+        self.digest = get_array_digest(verts, tris)
+        self.feature_edges = None
+        self.feature_edge_length = None
+
+    def get_feature_edges(self):
+        """Returns (cached) feature edge vertex indices, see
+        get_feature_edges()
+        """
+
+        if self.feature_edges is None:
+            self.feature_edges = get_feature_edges(
+                self.verts, self.tris, FEATURE_INCLUDED_ANGLE)
+        return self.feature_edges
+
+    def get_feature_edge_length(self):
+        """Returns (cached) total length of feature edges"""
+
+        if self.feature_edge_length is None:
+            self.feature_edge_length = get_edge_length(
+                self.verts, self.get_feature_edges())
+        return self.feature_edge_length
+
+
+# Cache of MeshData. Objects without modifiers share the data of their
+# mesh datablock, so linked duplicates are evaluated only once. Key is
+# ('MESH', mesh name) or ('OBJECT', object name). Entries are removed
+# upon geometry updates by depsgraph_update_post_handler().
+mesh_data_cache = dict()
+
+def get_mesh_data_key(obj):
+    """Returns mesh data cache key for mesh object obj"""
+
+    if len(obj.modifiers) == 0:
+        return ('MESH', obj.data.name)
+    return ('OBJECT', obj.name)
+
+
+def get_mesh_data(obj, depsgraph=None):
+    """Returns (possibly cached) MeshData for mesh object obj"""
+
+    key = get_mesh_data_key(obj)
+    data = mesh_data_cache.get(key)
+    if data is None:
+        data = MeshData(*get_mesh_arrays(obj, depsgraph))
+        mesh_data_cache[key] = data
+    return data
+
+
+def evaluate_mesh_data(obj, depsgraph=None):
+    """Returns new MeshData of the current evaluated mesh of object obj,
+    without using cached data. Mesh data cache entry of obj is replaced
+    with the new data, and cached area of obj is removed.
+    """
+
+    data = MeshData(*get_mesh_arrays(obj, depsgraph))
+    mesh_data_cache[get_mesh_data_key(obj)] = data
+    surface_area_cache.pop(obj.name, None)
+    return data
+
+
+def get_array_digest(verts, elements):
+    """Returns digest (hex string) of local vertex coordinates verts
+    and element (triangle or edge) vertex indices
+    """
+
+    import hashlib
+    h = hashlib.sha1()
+    h.update(numpy.ascontiguousarray(verts).tobytes())
+    h.update(numpy.ascontiguousarray(elements).tobytes())
+    return h.hexdigest()
+
+
+def get_instance_area(data, matrix):
+    """Returns surface area of MeshData data transformed with 4x4 matrix.
+    For transformations consisting of rotation, translation and uniform
+    scaling, area is obtained directly from the area of mesh data.
+    """
+
+    m = numpy.array(matrix, dtype=numpy.float64)[:3, :3]
+    if is_similarity_matrix(m):
+        return (m.T @ m)[0, 0] * data.area
+    return float(get_triangle_areas(data.verts @ m.T, data.tris).sum())
+
+
+def is_similarity_matrix(m):
+    """Returns True if 3x3 numpy matrix m consists of rotation,
+    reflection and uniform scaling only, so it preserves angles
+    """
+
+    mtm = m.T @ m
+    s2 = mtm[0, 0]
+    return numpy.allclose(mtm, s2 * numpy.eye(3), rtol=0.0, atol=1e-9 * s2)
+
+
+def get_triangle_areas(verts, tris):
+    """Returns numpy array of areas of triangles tris (vertex indices
+    to numpy vertex coordinate array verts)
+    """
+
+    tri_coords = verts[tris]
+    cross = numpy.cross(tri_coords[:, 1] - tri_coords[:, 0],
+                        tri_coords[:, 2] - tri_coords[:, 0])
+    return 0.5 * numpy.linalg.norm(cross, axis=1)
+
+
+def get_enclosed_volume(verts, tris):
+    """Returns signed volume enclosed by triangles tris (vertex indices
+    to numpy vertex coordinate array verts). Result is meaningful only
+    for closed surfaces.
+    """
+
+    tri_coords = verts[tris]
+    cross = numpy.cross(tri_coords[:, 1], tri_coords[:, 2])
+    return float(numpy.einsum('ij,ij->', tri_coords[:, 0], cross)) / 6.0
+
+
+def get_feature_edges(verts, tris, included_angle):
+    """Returns numpy array of shape (M, 2) of vertex indices of feature
+    edges of triangles tris (vertex indices to numpy vertex coordinate
+    array verts). Feature edges are open and non-manifold edges, and
+    edges where the angle between adjacent faces is smaller than
+    included_angle (in degrees), like in surfaceFeatures. Coincident
+    vertices are merged before edge connectivity is determined.
+    """
+
+    if len(tris) == 0:
+        return numpy.empty((0, 2), dtype=numpy.int32)
+
+    # Merge coincident vertices, like OpenFOAM does for STL files
+    unique_verts, first, inverse = numpy.unique(
+        verts, axis=0, return_index=True, return_inverse=True)
+    merged = inverse.reshape(-1)[tris]
+
+    # All triangle edges with sorted merged vertex indices
+    edges = numpy.sort(merged[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    faces = numpy.repeat(numpy.arange(len(tris)), 3)
+    valid = edges[:, 0] != edges[:, 1]
+    edges = edges[valid]
+    faces = faces[valid]
+
+    unique_edges, edge_index, counts = numpy.unique(
+        edges, axis=0, return_inverse=True, return_counts=True)
+    order = numpy.argsort(edge_index.reshape(-1), kind='stable')
+    starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+
+    # Unit face normals, zero for degenerate faces
+    tri_coords = verts[tris]
+    normals = numpy.cross(tri_coords[:, 1] - tri_coords[:, 0],
+                          tri_coords[:, 2] - tri_coords[:, 0])
+    lengths = numpy.linalg.norm(normals, axis=1)
+    nonzero = lengths > 0.0
+    normals[nonzero] /= lengths[nonzero, None]
+
+    # Manifold edges are features if normals of the two faces differ
+    # by more than 180 - included_angle degrees
+    is_feature = counts != 2
+    manifold = numpy.nonzero(counts == 2)[0]
+    f1 = faces[order[starts[manifold]]]
+    f2 = faces[order[starts[manifold] + 1]]
+    cos = numpy.einsum('ij,ij->i', normals[f1], normals[f2])
+    cos[~(nonzero[f1] & nonzero[f2])] = 1.0
+    is_feature[manifold] = cos < math.cos(math.radians(180.0 - included_angle))
+
+    return first[unique_edges[is_feature]].astype(numpy.int32)
+
+
+# Cache of feature edges of objects with non-uniform scaling. Key is
+# object name, value is a list of MeshData, world matrix, edges and
+# total edge length in world coordinates (None until calculated).
+# Entries are removed upon geometry updates by
+# depsgraph_update_post_handler().
+feature_edge_cache = dict()
+
+def get_instance_feature_edges(obj, data):
+    """Returns feature edge vertex indices (see get_feature_edges()) of
+    MeshData data of object obj in world coordinates. Transformations
+    which preserve angles don't change feature edges, so the edges of
+    the mesh data are used. Otherwise feature edges are extracted from
+    transformed coordinates, like from the exported STL file.
+    """
+
+    m = numpy.array(obj.matrix_world, dtype=numpy.float64)[:3, :3]
+    if is_similarity_matrix(m):
+        return data.get_feature_edges()
+
+    return get_scaled_feature_edge_entry(obj, data, m)[2]
+
+
+def get_scaled_feature_edge_entry(obj, data, m):
+    """Returns (cached) feature_edge_cache entry of object obj with
+    MeshData data and non-similarity 3x3 world matrix m
+    """
+
+    matrix = tuple(tuple(row) for row in m.tolist())
+    cached = feature_edge_cache.get(obj.name)
+    if cached and cached[0] is data and cached[1] == matrix:
+        return cached
+
+    edges = get_feature_edges(data.verts @ m.T, data.tris,
+                              FEATURE_INCLUDED_ANGLE)
+    cached = [data, matrix, edges, None]
+    feature_edge_cache[obj.name] = cached
+    return cached
+
+
+def get_edge_length(verts, edges):
+    """Returns total length of edges (numpy array of shape (M, 2) of
+    indices to numpy vertex coordinate array verts)
+    """
+
+    if len(edges) == 0:
+        return 0.0
+    vectors = verts[edges[:, 1]] - verts[edges[:, 0]]
+    return float(numpy.linalg.norm(vectors, axis=1).sum())
+
+
+def get_instance_feature_edge_length(obj, data):
+    """Returns (cached) total length of feature edges of MeshData data
+    of object obj in world coordinates
+    """
+
+    m = numpy.array(obj.matrix_world, dtype=numpy.float64)[:3, :3]
+    if is_similarity_matrix(m):
+        return math.sqrt((m.T @ m)[0, 0]) * data.get_feature_edge_length()
+
+    cached = get_scaled_feature_edge_entry(obj, data, m)
+    if cached[3] is None:
+        cached[3] = get_edge_length(data.verts @ m.T, cached[2])
+    return cached[3]
+
+
+def get_instance_volume(data, matrix):
+    """Returns enclosed volume of MeshData data transformed with
+    4x4 matrix
+    """
+
+    m = numpy.array(matrix, dtype=numpy.float64)[:3, :3]
+    return abs(numpy.linalg.det(m) * data.volume)
+
+
+# Number of buffer cells between refinement levels (nCellsBetweenLevels
+# in snappyHexMeshDictTemplate)
+N_CELLS_BETWEEN_LEVELS = 4
+
+# Included angle (in degrees) for feature edge extraction
+# (includedAngle in surfaceFeaturesDictTemplate)
+FEATURE_INCLUDED_ANGLE = 150.0
+
+# Maximum refinement level of object settings
+MAX_REFINEMENT_LEVEL = 10
+
+
+def estimate_cell_counts(gui, items, bb_min, bb_max):
+    """Returns estimated additional castellated cell counts and final
+    cell counts (after layer addition) per object, and total
+    castellated and final cell counts. items is a list of tuples of
+    (settings, obj), where settings contains the shmg_* settings used
+    for mesh object obj. bb_min and bb_max are the global bounding box
+    coordinates.
+
+    Background mesh cells are refined to the surface refinement
+    level in a band extending N_CELLS_BETWEEN_LEVELS cells to both
+    sides of the surface on each level, to the feature edge level in
+    a tube around feature edges and to the volume refinement level in
+    the enclosed (or outside) volume. Each surface face at the maximum
+    surface level gains one cell per added layer. Overlapping regions
+    are counted for each object, so the estimate is an upper limit.
+    """
+
+    h0 = gui.cell_side_length
+    n_background = get_block_mesh_cell_count(bb_min, bb_max, h0)
+    domain_volume = n_background * h0**3
+    n_items = len(items)
+    if n_items == 0:
+        empty = numpy.zeros(0)
+        return empty, empty, n_background, n_background
+
+    # Per object data
+    area = numpy.zeros(n_items)
+    volume = numpy.zeros(n_items)
+    edge_length = numpy.zeros(n_items)
+    surface_level = numpy.zeros(n_items, dtype=numpy.int32)
+    feature_level = numpy.zeros(n_items, dtype=numpy.int32)
+    volume_level = numpy.zeros(n_items, dtype=numpy.int32)
+    outside = numpy.zeros(n_items, dtype=bool)
+    layers = numpy.zeros(n_items)
+
+    for i, (settings, obj) in enumerate(items):
+        data = get_mesh_data(obj)
+        area[i] = get_surface_area(obj)
+        if settings.shmg_include_snapping and gui.do_castellation:
+            surface_level[i] = settings.shmg_surface_max_level
+        if settings.shmg_include_feature_extraction and gui.do_castellation \
+           and settings.shmg_feature_edge_level > surface_level[i]:
+            feature_level[i] = settings.shmg_feature_edge_level
+            edge_length[i] = get_instance_feature_edge_length(obj, data)
+        if settings.shmg_volume_type != 'none' and gui.do_castellation:
+            volume_level[i] = settings.shmg_volume_level
+            outside[i] = settings.shmg_volume_type == 'outside'
+            volume[i] = get_instance_volume(data, obj.matrix_world)
+        if gui.do_add_layers and settings.shmg_surface_layers > 0:
+            layers[i] = settings.shmg_surface_layers
+            if settings.shmg_slave_side_layers:
+                layers[i] *= 2
+
+    # Cell side lengths h[j] for levels 1..MAX_REFINEMENT_LEVEL
+    levels = numpy.arange(1, MAX_REFINEMENT_LEVEL + 1)
+    h = h0 / 2.0**levels
+    n = N_CELLS_BETWEEN_LEVELS
+
+    # Refined region volumes per object and level. Region of level l
+    # includes the regions of higher levels.
+    in_surface = levels[None, :] <= surface_level[:, None]
+    band = numpy.cumsum(numpy.where(in_surface, h, 0.0)[:, ::-1],
+                        axis=1)[:, ::-1]
+    h_surface = h0 / 2.0**surface_level
+    regions = area[:, None] * (h_surface[:, None] + 2 * n * band) \
+        * in_surface
+
+    in_feature = (levels[None, :] > surface_level[:, None]) \
+        & (levels[None, :] <= feature_level[:, None])
+    regions += math.pi * (n * h[None, :])**2 * edge_length[:, None] \
+        * in_feature
+
+    in_volume = levels[None, :] <= volume_level[:, None]
+    enclosed = numpy.where(outside, domain_volume - volume, volume)
+    regions += numpy.maximum(enclosed, 0.0)[:, None] * in_volume
+
+    # Each refinement splits a cell into eight
+    regions = numpy.minimum(regions, domain_volume)
+    castellated = (regions / h[None, :]**3).sum(axis=1) * 7.0 / 8.0
+    final = castellated + layers * area / h_surface**2
+
+    return castellated, final, \
+        n_background + int(castellated.sum()), \
+        n_background + int(final.sum())
+
+
+def get_cell_count_estimate_items(objects):
+    """Returns list of estimate_cell_counts() items for objects"""
+
+    return [(ob, ob) for ob in objects if ob.type == 'MESH' \
+            and ob.shmg_include_in_export and not ob.name.endswith("_eMesh")]
+
+
+# Cache of total cell count estimates. Key is scene name, value is a
+# tuple of the scene settings used by the estimate (see
+# get_cell_count_estimate_settings()) and estimated castellated and
+# final cell counts. Cache is cleared by depsgraph_update_post_handler()
+# upon updates of objects included in export.
+cell_count_estimate_cache = dict()
+
+def get_cell_count_estimate_settings(gui):
+    """Returns tuple of scene settings gui which affect cell count
+    estimates
+    """
+
+    return (gui.cell_side_length, gui.do_castellation, gui.do_add_layers)
+
+
+def get_cached_cell_count_estimate(scene):
+    """Returns cached estimated total castellated and final cell
+    counts for scene, see estimate_cell_counts()
+    """
+
+    settings = get_cell_count_estimate_settings(scene.snappyhexmeshgui)
+    cached = cell_count_estimate_cache.get(scene.name)
+    if cached is None or cached[0] != settings:
+        bb_min, bb_max = get_cached_global_bbox_coords(scene)
+        items = get_cell_count_estimate_items(bpy.data.objects)
+        if items:
+            counts = estimate_cell_counts(
+                scene.snappyhexmeshgui, items, bb_min, bb_max)[2:]
+        else:
+            counts = (0, 0)
+        cached = (settings, counts)
+        cell_count_estimate_cache[scene.name] = cached
+    return cached[1]
+
+
+# Default castellation limits (maxLocalCells and maxGlobalCells) used
+# when resource planner is not enabled
+DEFAULT_MAX_LOCAL_CELLS = 100000
+DEFAULT_MAX_GLOBAL_CELLS = 10000000
+
+# Approximate peak memory usage of snappyHexMesh per cell in bytes
+BYTES_PER_CELL = 2000
+
+
+def get_resource_plan(scene):
+    """Returns tuple of number of parallel processes (ranks),
+    maxLocalCells and maxGlobalCells for scene. If resource planner is
+    enabled, ranks are chosen so that the estimated peak cell count
+    gives cells_per_rank cells per rank without exceeding the memory of
+    a core, limited to available cores. maxLocalCells is the cell
+    count which fits in the memory of one core (limited to
+    cells_per_rank), so refinement switches to balancing before
+    refinement early enough, and maxGlobalCells stops refinement
+    before the memory of all ranks runs out.
+    """
+
+    gui = scene.snappyhexmeshgui
+    if not gui.use_resource_planner:
+        return gui.number_of_cpus, DEFAULT_MAX_LOCAL_CELLS, \
+            DEFAULT_MAX_GLOBAL_CELLS
+
+    memory_cells = int(gui.memory_per_core * 1e9 / BYTES_PER_CELL)
+    n_ranks = min(get_required_ranks(scene), gui.available_cores)
+    max_local_cells = min(memory_cells, gui.cells_per_rank)
+    max_global_cells = n_ranks * memory_cells
+    return n_ranks, max_local_cells, max_global_cells
+
+
+def get_required_ranks(scene):
+    """Returns number of parallel processes (ranks) required by the
+    resource planner for the estimated peak cell count, before limiting
+    it to available cores
+    """
+
+    gui = scene.snappyhexmeshgui
+    n_peak = max(get_cached_cell_count_estimate(scene))
+    memory_cells = int(gui.memory_per_core * 1e9 / BYTES_PER_CELL)
+    return max(1, math.ceil(n_peak / gui.cells_per_rank),
+               math.ceil(n_peak / memory_cells))
+
+
+def get_resource_plan_warning(scene):
+    """Returns warning text if resource planner needs more ranks than
+    there are available cores, otherwise None
+    """
+
+    gui = scene.snappyhexmeshgui
+    if not gui.use_resource_planner:
+        return None
+    n_required = get_required_ranks(scene)
+    if n_required <= gui.available_cores:
+        return None
+    return "Plan needs %d cores, limited to %d available" \
+        % (n_required, gui.available_cores)
+
+
+def get_number_of_cpus(scene):
+    """Returns number of parallel processes to use for scene"""
+
+    return get_resource_plan(scene)[0]
+
+
+@bpy.app.handlers.persistent
+def depsgraph_update_post_handler(scene, depsgraph):
+    """Removes cached object data when object geometry or
+    transformation is updated
+    """
+
+    for update in depsgraph.updates:
+        # Adding or removing objects updates collections
+        if isinstance(update.id, bpy.types.Collection):
+            global_bbox_cache.clear()
+            cell_count_estimate_cache.clear()
+            continue
+        # Cell count estimates depend on settings, geometry and
+        # transformation of included objects. Scene settings are
+        # checked by get_cached_cell_count_estimate().
+        if isinstance(update.id, bpy.types.Object) \
+           and update.id.type == 'MESH' and update.id.shmg_include_in_export:
+            cell_count_estimate_cache.clear()
+        if not (update.is_updated_geometry or update.is_updated_transform):
+            continue
+        if isinstance(update.id, bpy.types.Object):
+            if update.id.type == 'MESH' and update.id.shmg_include_in_export:
+                global_bbox_cache.clear()
+            if update.is_updated_geometry:
+                surface_area_cache.pop(update.id.name, None)
+                feature_edge_cache.pop(update.id.name, None)
+                mesh_data_cache.pop(('OBJECT', update.id.name), None)
+        elif isinstance(update.id, bpy.types.Mesh):
+            global_bbox_cache.clear()
+            cell_count_estimate_cache.clear()
+            mesh_data_cache.pop(('MESH', update.id.name), None)
+            for name, cached in list(surface_area_cache.items()):
+                if cached[0] == update.id.name:
+                    del surface_area_cache[name]
+
+
+@bpy.app.handlers.persistent
+def load_post_handler(dummy):
+    """Clears cached object data and loaded run metrics and reports
+    when a Blender file is loaded
+    """
+
+    surface_area_cache.clear()
+    global_bbox_cache.clear()
+    mesh_data_cache.clear()
+    feature_edge_cache.clear()
+    cell_count_estimate_cache.clear()
+
+    from .op_run import run_metrics, run_report
+    run_metrics.clear()
+    run_report.clear()
+
+
+def get_mesh_arrays(obj, depsgraph=None):
+    """Returns vertex coordinates and triangle vertex indices of the
+    evaluated (modifiers applied) mesh of object obj as numpy arrays
+    of shape (N, 3), in object local coordinates.
+    """
+
+    if depsgraph is None:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+    ob_eval = obj.evaluated_get(depsgraph)
+    mesh = ob_eval.to_mesh()
+    mesh.calc_loop_triangles()
+
+    verts = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("co", verts)
+    tris = numpy.empty(len(mesh.loop_triangles) * 3, dtype=numpy.int32)
+    mesh.loop_triangles.foreach_get("vertices", tris)
+    ob_eval.to_mesh_clear()
+
+    return verts.reshape(-1, 3).astype(numpy.float64), tris.reshape(-1, 3)
+
+
+def get_mesh_edge_arrays(obj, depsgraph=None):
+    """Returns vertex coordinates and edge vertex indices of the
+    evaluated (modifiers applied) mesh of object obj as numpy arrays
+    of shape (N, 3) and (M, 2), in object local coordinates.
+    """
+
+    if depsgraph is None:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+    ob_eval = obj.evaluated_get(depsgraph)
+    mesh = ob_eval.to_mesh()
+
+    verts = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("co", verts)
+    edges = numpy.empty(len(mesh.edges) * 2, dtype=numpy.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    ob_eval.to_mesh_clear()
+
+    return verts.reshape(-1, 3).astype(numpy.float64), edges.reshape(-1, 2)
+
+
+def get_transformed_coords(verts, matrix, scale=1.0):
+    """Returns vertex coordinates verts (numpy array of shape (N, 3))
+    transformed with 4x4 matrix and multiplied by scale
+    """
+
+    m = numpy.array(matrix, dtype=numpy.float64)[:3] * scale
+    coords = numpy.empty((len(verts), 4), dtype=numpy.float64)
+    coords[:, :3] = verts
+    coords[:, 3] = 1.0
+    return coords @ m.T
+
+
 def get_scaled_object_names():
     """Returns string of object names which apply object scaling"""
 
@@ -0,0 +1,520 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8-80 compliant>
+
+# ----------------------------------------------------------------------------
+# Run related functionality
+from .op_gen import *
+
+# ----------------------------------------------------------------------------
+
+# Step metrics loaded from the run metrics file of the case directory,
+# shown in the Run panel. List of dictionaries, see read_run_metrics().
+run_metrics = []
+
+
+class OBJECT_OT_snappyhexmeshgui_load_run_metrics(bpy.types.Operator):
+    """Load Step Timing and Memory Usage Recorded by Run Script (SnappyHexMeshGUI)"""
+    bl_idname = "object.snappyhexmeshgui_load_run_metrics"
+    bl_label = "SnappyHexMeshGUI Load Run Metrics"
+
+    def execute(self, context):
+        from .op_export import RUN_METRICS_NAME
+        gui = context.scene.snappyhexmeshgui
+        filepath = os.path.join(bpy.path.abspath(gui.export_path),
+                                RUN_METRICS_NAME)
+        if not os.path.isfile(filepath):
+            self.report({'ERROR'}, "No run metrics found in %r" % filepath)
+            return {'CANCELLED'}
+
+        run_metrics[:] = read_run_metrics(filepath)
+        total = sum(m["elapsed"] or 0.0 for m in run_metrics)
+        self.report({'INFO'}, "Loaded metrics of %d steps, total time %.1f s" \
+                    % (len(run_metrics), total))
+        return {'FINISHED'}
+
+
+def read_run_metrics(filepath):
+    """Returns list of step metrics dictionaries read from JSON lines
+    file filepath. If a step has been run several times, only the
+    latest record is kept. Records are in the order of completion.
+    Invalid lines (e.g. from an interrupted run) are skipped.
+    """
+
+    import json
+    records = dict()
+    with open(filepath, 'r') as infile:
+        for line in infile:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict) or "step" not in record:
+                continue
+            # Remove old record so that dictionary order follows the
+            # latest completion order
+            records.pop(record["step"], None)
+            records[record["step"]] = record
+    return list(records.values())
+
+
+def get_run_metrics_rows(metrics):
+    """Returns list of tuples of (step name, elapsed time text,
+    share of total elapsed time text, CPU time text, maximum memory
+    text, status) for metrics
+    """
+
+    total = sum(m.get("elapsed") or 0.0 for m in metrics)
+    rows = []
+    for m in metrics:
+        elapsed = m.get("elapsed")
+        cpu = (m.get("user") or 0.0) + (m.get("sys") or 0.0)
+        max_rss = m.get("max_rss_kb")
+        rows.append((
+            m["step"],
+            "%.1f s" % elapsed if elapsed is not None else "-",
+            "%.0f %%" % (100.0 * elapsed / total) \
+            if elapsed is not None and total > 0.0 else "-",
+            "%.1f s" % cpu,
+            "%.0f MB" % (max_rss / 1024.0) if max_rss is not None else "-",
+            m.get("status", 0),
+        ))
+    return rows
+
+
+# Parsed log reports shown in the Run panel, see parse_case_logs()
+run_report = dict()
+
+
+class OBJECT_OT_snappyhexmeshgui_parse_logs(bpy.types.Operator):
+    """Parse snappyHexMesh and checkMesh Log Files of Case Directory (SnappyHexMeshGUI)"""
+    bl_idname = "object.snappyhexmeshgui_parse_logs"
+    bl_label = "SnappyHexMeshGUI Parse Logs"
+
+    def execute(self, context):
+        gui = context.scene.snappyhexmeshgui
+        abspath = bpy.path.abspath(gui.export_path)
+        report = parse_case_logs(abspath)
+        if report["snappy"] is None and report["check"] is None:
+            self.report({'ERROR'}, "No log.snappyHexMesh or log.checkMesh " \
+                        + "found in %r" % abspath)
+            return {'CANCELLED'}
+        run_report.clear()
+        run_report.update(report)
+        self.report({'INFO'}, "Parsed logs in %r" % abspath)
+        return {'FINISHED'}
+
+
+class SnappyLogParser:
+    """Streaming parser for snappyHexMesh log. Feed log lines one by
+    one to feed(). Collects refinement iterations as tuples of
+    (iteration name, cell count), phase times as tuples of (phase name,
+    time in seconds), memory usage lines as tuples of (phase name,
+    text) and layer coverage per patch as tuples of (patch name, face
+    count, average number of layers, overall thickness, thickness
+    percentage or None).
+    """
+
+    ITERATION_RE = re.compile(r"^After refinement (.+?) : cells:\s*(\d+)")
+    PHASE_TIME_RE = re.compile(
+        r"^(Mesh refined|Mesh snapped|Layers added|Finished meshing) "
+        r"in = ([-+0-9.eE]+) s")
+    PHASE_NAMES = {
+        "Mesh refined": "Castellation",
+        "Mesh snapped": "Snapping",
+        "Layers added": "Layer Addition",
+        "Finished meshing": "Total",
+    }
+    MEMORY_RE = re.compile(r"\bmem(ory)?\b", re.IGNORECASE)
+
+    def __init__(self):
+        self.iterations = []
+        self.phase_times = []
+        self.memory = []
+        self.layers = []
+        self.phase = "Castellation"
+        # Layer table parsing state: None, 'header' or 'rows'
+        self.table = None
+        self.table_has_percentage = False
+
+    def feed(self, line):
+        line = line.strip()
+        if self.table is not None:
+            self.feed_layer_table(line)
+            return
+
+        match = self.ITERATION_RE.match(line)
+        if match:
+            self.iterations.append((match.group(1), int(match.group(2))))
+            return
+
+        match = self.PHASE_TIME_RE.match(line)
+        if match:
+            name = self.PHASE_NAMES[match.group(1)]
+            self.phase_times.append((name, float(match.group(2))))
+            if name == "Castellation":
+                self.phase = "Snapping"
+            elif name == "Snapping":
+                self.phase = "Layer Addition"
+            return
+
+        if line.startswith("patch") and "faces" in line and "layers" in line:
+            # Start of layer coverage table. Older tables of the same
+            # log (e.g. from earlier layer iterations) are replaced.
+            self.layers = []
+            self.table = 'header'
+            self.table_has_percentage = False
+            return
+
+        if self.MEMORY_RE.search(line) and any(c.isdigit() for c in line):
+            self.memory.append((self.phase, line))
+
+    def feed_layer_table(self, line):
+        """Parses a line of layer coverage table"""
+
+        if self.table == 'header':
+            if "%" in line:
+                self.table_has_percentage = True
+            if line.startswith("-"):
+                self.table = 'rows'
+            return
+
+        fields = line.split()
+        if len(fields) < 4:
+            self.table = None
+            return
+        try:
+            values = [float(v) for v in fields[1:]]
+        except ValueError:
+            self.table = None
+            return
+        # Newer tables end with overall thickness and percentage,
+        # older ones with near-wall and overall thickness
+        percentage = None
+        if self.table_has_percentage:
+            thickness, percentage = values[-2], values[-1]
+        else:
+            thickness = values[-1]
+        self.layers.append((fields[0], int(values[0]), values[1],
+                            thickness, percentage))
+
+
+class CheckMeshLogParser:
+    """Streaming parser for checkMesh log. Feed log lines one by one to
+    feed(). Collects number of cells, failed check messages and the
+    number of failed checks reported by checkMesh (None if checkMesh
+    did not finish).
+    """
+
+    CELLS_RE = re.compile(r"^cells:\s*(\d+)")
+    FAILED_RE = re.compile(r"^Failed (\d+) mesh checks")
+
+    def __init__(self):
+        self.cells = None
+        self.failed_checks = []
+        self.n_failed = None
+
+    def feed(self, line):
+        line = line.strip()
+        match = self.CELLS_RE.match(line)
+        if match:
+            self.cells = int(match.group(1))
+        elif line.startswith("***"):
+            self.failed_checks.append(line.lstrip("*").strip())
+        elif line.startswith("Mesh OK"):
+            self.n_failed = 0
+        else:
+            match = self.FAILED_RE.match(line)
+            if match:
+                self.n_failed = int(match.group(1))
+
+
+def parse_log(filepath, parser):
+    """Feeds lines of log file filepath to parser one at a time, so
+    that large logs are not read into memory. Returns parser, or None
+    if file does not exist.
+    """
+
+    if not os.path.isfile(filepath):
+        return None
+    with open(filepath, 'r', errors='replace') as infile:
+        for line in infile:
+            parser.feed(line)
+    return parser
+
+
+def get_export_date(filepath):
+    """Returns export date text from the header of case dictionary
+    filepath, or None if not found
+    """
+
+    if not os.path.isfile(filepath):
+        return None
+    with open(filepath, 'r', errors='replace') as infile:
+        for i, line in enumerate(infile):
+            if line.startswith("// Export date:"):
+                return line.split(":", 1)[1].strip()
+            if i > 50:
+                break
+    return None
+
+
+def parse_case_logs(abspath):
+    """Returns report dictionary of parsed snappyHexMesh and checkMesh
+    logs in case directory abspath. Contains SnappyLogParser of all
+    snappyHexMesh passes ('snappy'), CheckMeshLogParser ('check') and
+    export date of snappyHexMeshDict which the logs were produced with
+    ('export_date').
+    """
+
+    # Logs of additional layer passes (log.snappyHexMesh_N) are fed to
+    # the same parser after the main log
+    snappy = parse_log(os.path.join(abspath, "log.snappyHexMesh"),
+                       SnappyLogParser())
+    if snappy:
+        names = [name for name in os.listdir(abspath) \
+                 if re.match(r"^log\.snappyHexMesh_\d+$", name)]
+        for name in sorted(names, key=lambda n: int(n.rsplit("_", 1)[1])):
+            parse_log(os.path.join(abspath, name), snappy)
+
+    return {
+        "snappy": snappy,
+        "check": parse_log(os.path.join(abspath, "log.checkMesh"),
+                           CheckMeshLogParser()),
+        "export_date": get_export_date(
+            os.path.join(abspath, "system", "snappyHexMeshDict")),
+    }
+
+
+# Currently running or last finished RunProcess, see run_case()
+active_run = None
+
+
+class OBJECT_OT_snappyhexmeshgui_run_case(bpy.types.Operator):
+    """Run the Generated run Script in Export Path in Background (SnappyHexMeshGUI)"""
+    bl_idname = "object.snappyhexmeshgui_run_case"
+    bl_label = "SnappyHexMeshGUI Run Case"
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT' and not is_run_active()
+
+    def execute(self, context):
+        gui = context.scene.snappyhexmeshgui
+        abspath = bpy.path.abspath(gui.export_path)
+        if not os.path.isfile(os.path.join(abspath, "run")):
+            self.report({'ERROR'}, "No run script in %r, please export " \
+                        "first" % abspath)
+            return {'CANCELLED'}
+        try:
+            run_case(abspath)
+        except OSError as e:
+            self.report({'ERROR'}, "Failed to start run: %s" % e)
+            return {'CANCELLED'}
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        # Runs are cancelled only with the Cancel Run button, so all
+        # events are passed through to the rest of the window
+        if not is_run_active():
+            if active_run.returncode == 0:
+                self.report({'INFO'}, "Run finished")
+            elif active_run.status == "Cancelled":
+                self.report({'WARNING'}, "Run cancelled")
+            else:
+                self.report({'ERROR'}, "Run failed: %s" % active_run.status)
+            return {'FINISHED'}
+        return {'PASS_THROUGH'}
+
+
+class OBJECT_OT_snappyhexmeshgui_cancel_run(bpy.types.Operator):
+    """Cancel Running run Script (SnappyHexMeshGUI)"""
+    bl_idname = "object.snappyhexmeshgui_cancel_run"
+    bl_label = "SnappyHexMeshGUI Cancel Run"
+
+    @classmethod
+    def poll(cls, context):
+        return is_run_active()
+
+    def execute(self, context):
+        cancel_run()
+        return {'FINISHED'}
+
+
+class RunProcess:
+    """Run script subprocess running in case directory abspath. Output
+    of the run script is read by a thread into a queue, and the log
+    file of the current step is tailed incrementally by update(), so
+    the user interface is never blocked.
+    """
+
+    # Maximum number of bytes read from log file per update
+    MAX_READ_SIZE = 1 << 20
+
+    def __init__(self, abspath):
+        import subprocess
+        import threading
+        import queue
+        self.abspath = abspath
+        self.step = None
+        self.status = "Starting"
+        self.returncode = None
+        self.output = []
+        self.log_parser = None
+        self.log_path = None
+        self.log_offset = 0
+        self.log_remainder = ""
+        self.lines = queue.Queue()
+        self.process = subprocess.Popen(
+            ["./run"], cwd=abspath, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, universal_newlines=True,
+            start_new_session=True)
+        self.reader = threading.Thread(target=self.read_output, daemon=True)
+        self.reader.start()
+
+    def read_output(self):
+        """Reads output lines of run script into queue (in a thread)"""
+
+        for line in self.process.stdout:
+            self.lines.put(line.rstrip("\n"))
+        self.process.stdout.close()
+
+    def update(self):
+        """Processes new output lines and log file contents. Returns
+        True while the process is running.
+        """
+
+        import queue
+        while True:
+            try:
+                line = self.lines.get_nowait()
+            except queue.Empty:
+                break
+            self.output = (self.output + [line])[-10:]
+            match = re.match(r"^Running (\S+) with command", line)
+            if match:
+                self.start_step(match.group(1))
+        self.tail_log()
+
+        if self.process.poll() is None or self.reader.is_alive():
+            return True
+        self.returncode = self.process.returncode
+        if self.returncode == 0:
+            self.status = "Finished"
+        elif self.returncode < 0:
+            self.status = "Cancelled"
+        else:
+            self.status = "Failed in %s" % self.step
+        return False
+
+    def start_step(self, step):
+        """Starts following the log file of step"""
+
+        self.tail_log()
+        self.step = step
+        self.status = "Running %s" % step
+        self.log_path = os.path.join(self.abspath, "log." + step)
+        self.log_offset = 0
+        self.log_remainder = ""
+        self.log_parser = None
+        if step.startswith("snappyHexMesh"):
+            self.log_parser = SnappyLogParser()
+
+    def tail_log(self):
+        """Feeds new complete lines of current log file to log parser"""
+
+        if self.log_parser is None or not os.path.isfile(self.log_path):
+            return
+        with open(self.log_path, 'r', errors='replace') as infile:
+            infile.seek(self.log_offset)
+            text = infile.read(self.MAX_READ_SIZE)
+            self.log_offset = infile.tell()
+        lines = (self.log_remainder + text).split("\n")
+        self.log_remainder = lines.pop()
+        for line in lines:
+            self.log_parser.feed(line)
+
+    def get_progress_text(self):
+        """Returns text describing latest refinement progress or phase"""
+
+        parser = self.log_parser
+        if parser is None:
+            return ""
+        if parser.phase_times:
+            name, seconds = parser.phase_times[-1]
+            return "%s done in %.1f s" % (name, seconds)
+        if parser.iterations:
+            return "%s: %d cells" % parser.iterations[-1]
+        return ""
+
+    def cancel(self):
+        """Terminates the process group of run script"""
+
+        import signal
+        if self.process.poll() is None:
+            try:
+                os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+            except OSError:
+                pass
+
+
+def is_run_active():
+    """Returns True if a run is in progress"""
+
+    return active_run is not None and active_run.returncode is None
+
+
+def run_case(abspath):
+    """Starts run script in case directory abspath and registers a
+    timer which follows its progress
+    """
+
+    global active_run
+    active_run = RunProcess(abspath)
+    bpy.app.timers.register(run_timer_tick, first_interval=0.5)
+
+
+def cancel_run():
+    """Cancels active run"""
+
+    if is_run_active():
+        active_run.cancel()
+
+
+def run_timer_tick():
+    """Timer function which updates progress of active run and redraws
+    the user interface. Loads run metrics when the run has ended.
+    """
+
+    if active_run is None:
+        return None
+    running = active_run.update()
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+    if running:
+        return 0.5
+
+    from .op_export import RUN_METRICS_NAME
+    filepath = os.path.join(active_run.abspath, RUN_METRICS_NAME)
+    if os.path.isfile(filepath):
+        run_metrics[:] = read_run_metrics(filepath)
+    return None
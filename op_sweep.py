@@ -0,0 +1,180 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8-80 compliant>
+
+# ----------------------------------------------------------------------------
+# Parametric sweep export
+from .op_gen import *
+
+# ----------------------------------------------------------------------------
+
+# Settings which affect the set or contents of exported geometry
+# (STL and eMesh) files, so they can't be swept with shared geometry files
+SWEEP_EXCLUDED_SETTINGS = (
+    "export_path",
+    "export_scale",
+    "export_stl_ascii",
+    "export_emesh_binary",
+    "extract_features_in_blender",
+    "shmg_include_in_export",
+    "shmg_include_feature_extraction",
+)
+
+
+class OBJECT_OT_snappyhexmeshgui_sweep_export(bpy.types.Operator):
+    """Export a Case for Each Combination of Sweep Parameter Values (SnappyHexMeshGUI)"""
+    bl_idname = "object.snappyhexmeshgui_sweep_export"
+    bl_label = "SnappyHexMeshGUI Sweep Export"
+
+    @classmethod
+    def poll(cls, context):
+        ob = context.active_object
+        return (ob and ob.type == 'MESH' and context.mode == 'OBJECT')
+
+    def execute(self, context):
+        n = sweep_export(self)
+        if n > 0:
+            self.report({'INFO'}, "Exported %d sweep cases" % n)
+        return {'FINISHED'}
+
+
+def parse_sweep_definition(text, gui, objects):
+    """Parses sweep definition string text into a list of tuples of
+    (property name, list of values). Definition consists of entries
+    like "cell_side_length=0.2,0.1,0.05" separated by semicolons.
+    Property names starting with "shmg_" refer to properties of mesh
+    objects in list objects, other names refer to settings in gui.
+    Values are converted to the type of the current property value.
+    Raises ValueError if definition is not valid.
+    """
+
+    params = []
+    for entry in text.split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "=" not in entry:
+            raise ValueError("Missing '=' in sweep entry %r" % entry)
+        name, values_text = [t.strip() for t in entry.split("=", 1)]
+
+        if name in SWEEP_EXCLUDED_SETTINGS:
+            raise ValueError("Setting %r can't be swept" % name)
+        if name.startswith("shmg_"):
+            if not objects:
+                raise ValueError("No mesh objects selected for %r" % name)
+            current = getattr(objects[0], name, None)
+        else:
+            current = getattr(gui, name, None)
+        if current is None or not isinstance(current, (bool, int, float, str)):
+            raise ValueError("Unknown sweep property %r" % name)
+
+        values = []
+        for value_text in values_text.split(","):
+            value_text = value_text.strip()
+            if isinstance(current, bool):
+                value = value_text.lower() in ("1", "true", "yes", "on")
+            else:
+                value = type(current)(value_text)
+            values.append(value)
+        if not values:
+            raise ValueError("No values given for %r" % name)
+        params.append((name, values))
+    return params
+
+
+def set_sweep_values(names, values, gui, objects):
+    """Sets property names to values in gui settings or objects"""
+
+    for name, value in zip(names, values):
+        if name.startswith("shmg_"):
+            for ob in objects:
+                setattr(ob, name, value)
+        else:
+            setattr(gui, name, value)
+
+
+def sweep_export(reporter):
+    """Exports one case directory for each combination of sweep
+    parameter values. Geometry is exported only once to a shared
+    folder and linked to the constant/triSurface folder of each case.
+    Returns number of exported cases.
+    """
+
+    from itertools import product
+    from .op_export import export_case, export_geometries, get_scene_snapshot
+
+    gui = bpy.context.scene.snappyhexmeshgui
+    objects = [ob for ob in bpy.data.objects \
+               if ob.type == 'MESH' and ob.select_get()]
+    try:
+        params = parse_sweep_definition(gui.sweep_definition, gui, objects)
+    except ValueError as e:
+        reporter.report({'ERROR'}, "Invalid sweep definition: %s" % e)
+        return 0
+    if not params:
+        reporter.report({'ERROR'}, "Sweep definition is empty")
+        return 0
+
+    abspath = bpy.path.abspath(gui.export_path)
+    if not abspath:
+        reporter.report({'ERROR'}, "No path set! Please save Blender file to "
+                        "a case folder and try again")
+        return 0
+    prefix = bpy.path.clean_name(gui.sweep_case_prefix)
+
+    # Export geometry to the shared geometry folder
+    store_path = os.path.join(abspath, prefix + "_geometry")
+    os.makedirs(os.path.join(store_path, 'constant', 'triSurface'), exist_ok=True)
+    geometry = export_geometries(get_scene_snapshot(), store_path)
+    if geometry[0] == 0:
+        reporter.report({'ERROR'}, "Can't export object %r " % geometry[1] \
+                        + " because it is not visible")
+        return 0
+
+    # Store original values to restore them after sweep
+    names = [name for name, values in params]
+    original_values = []
+    for name in names:
+        if name.startswith("shmg_"):
+            original_values.append([getattr(ob, name) for ob in objects])
+        else:
+            original_values.append(getattr(gui, name))
+
+    summary = ""
+    n = 0
+    try:
+        for values in product(*[values for name, values in params]):
+            n += 1
+            case_path = os.path.join(abspath, "%s_%d" % (prefix, n))
+            set_sweep_values(names, values, gui, objects)
+            if export_case(reporter, case_path, geometry) == 0:
+                return 0
+            summary += os.path.basename(case_path) + " " \
+                + " ".join("%s=%s" % (k, v) for k, v in zip(names, values)) + "\n"
+    finally:
+        for name, original in zip(names, original_values):
+            if name.startswith("shmg_"):
+                for ob, value in zip(objects, original):
+                    setattr(ob, name, value)
+            else:
+                setattr(gui, name, original)
+
+    with open(os.path.join(abspath, prefix + "_cases.txt"), 'w') as outfile:
+        outfile.write(summary)
+    return n